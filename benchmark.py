@@ -0,0 +1,703 @@
+"""
+micro benchmarks for BNU-Schoolwork-Assist
+
+usage: python benchmark.py [--json results.json] [name ...]
+
+every benchmark returns its numbers as a dict, --json writes them to a file
+so runs can be compared
+"""
+import argparse
+import platform
+import os
+import random
+import sys
+import tempfile
+import gc
+import json
+import pickle
+import threading
+import time
+import tracemalloc
+
+import des
+from bnujwc import (BNUjwc, Course, GrabScheduler, StatsRecorder, TABLE_PARSERS, Timetable, conflict_matrix,
+                    course_mask, parse_schedule, schedule_mask, to_json)
+from mockserver import MockServer, synthetic_courses
+
+_SAMPLE_COURSE = {
+    'kcdm': '0410036171', 'skbjdm': '0410036171-02', 'kclb1': '01', 'kclb2': '02', 'khfs': '01',
+    'xf': '2.0', 'kc': '[0410036171]跨文化交际英语课程',
+}
+
+
+def _offline_client(des_engine='python'):
+    """
+    BNUjwc with student info, select info and _deskey already cached, so no request is sent
+    """
+    jwc = BNUjwc('201411000000', '', des_engine=des_engine, deskey_ttl=1e9, deskey_prefetch=1,
+                 select_info_ttl=1e9)
+    jwc._info = {'xh': '201411000000', 'zydm': '0410', 'nj': '2014', 'xn': '2015', 'xq_m': '1'}
+    for xktype in ('2', '5'):
+        jwc._select_info_cache[xktype] = (time.time(), {
+            'xktype': xktype, 'xh': '201411000000', 'xn': '2015', 'xqM': '1', 'nj': '2014'})
+    jwc._deskey = 'a1b2c3d4e5f6'
+    jwc._deskey_time = time.time()
+    return jwc
+
+
+def _timeit(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def _sample(func, number):
+    """
+    :return: seconds taken by each of number calls
+    """
+    samples = []
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _summary(samples, elapsed=None):
+    """
+    :param samples: seconds per operation
+    :param elapsed: wall time of the whole run, sum of samples if None
+    :return: {'count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'per_sec'}
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    elapsed = sum(ordered) if elapsed is None else elapsed
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+        'per_sec': len(ordered) / elapsed if elapsed else 0.0,
+    }
+
+
+def _golden_vectors():
+    """
+    (data, keys, strEnc output) recorded once from des.js, see tests/test_des.py
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'fixtures', 'des_vectors.json')
+    with open(path, encoding='utf-8') as f:
+        return [(v['data'], (v['first_key'], v['second_key'], v['third_key']), v['enc']) for v in json.load(f)]
+
+
+def bench_des(number=200):
+    """
+    encryptions per second of every DES engine, after checking that all engines
+    produce the same output as des.js
+    """
+    params = 'xktype=2&initQry=0&xh=201411000000&xn=2015&xq=1&nj=2014&zydm=0410&kcdm=0410036171' \
+             '&kclb1=01&kclb2=02&khfs=01&skbjdm=0410036171-02&skbzdm=&xf=2.0&kcfw=zxggrx&njzy=2014|0410' \
+             '&items=&is_xjls=undefined&kcmc=&t_skbh=&menucode_current=JW130415'
+    key = 'a1b2c3d4e5f6'
+
+    engines = {'python': des.get_des_engine('python')}
+    try:
+        engines['execjs'] = des.get_des_engine('execjs')
+    except Exception as e:
+        print('des: execjs engine unavailable (%s)' % e)
+
+    vectors = _golden_vectors()
+    for data, keys, enc in vectors:
+        if des.str_enc(data, *keys) != enc or des.str_dec(enc, *keys) != data:
+            raise AssertionError('python DES differs from des.js: %r %r' % (data, keys))
+    if 'execjs' in engines:
+        for data, keys, enc in vectors:
+            if keys[1:] == (None, None) and engines['execjs'].str_enc(data, keys[0]) != enc:
+                raise AssertionError('des.js engine differs from the recorded vectors: %r %r' % (data, keys))
+    print('des: %d golden vectors match des.js' % len(vectors))
+
+    results = {}
+    for name, engine in engines.items():
+        n = number if name == 'python' else max(number // 20, 5)
+        elapsed = _timeit(lambda: engine.str_enc(params, key), n)
+        print('des[%s]: %.1f enc/s (%.3f ms/enc)' % (name, n / elapsed, elapsed / n * 1000))
+        results[name] = {'per_sec': n / elapsed}
+    return results
+
+
+def bench_prepared(number=2000):
+    """
+    per-attempt CPU cost of building an elective selection payload,
+    from scratch (as select_elective_course did) vs. from a PreparedSelection
+    """
+    jwc = _offline_client()
+    course = _SAMPLE_COURSE
+
+    def from_scratch():
+        prepared = jwc.prepare_elective_course(course)
+        jwc._encrypt_params(prepared.params)
+
+    prepared = jwc.prepare_elective_course(course)
+
+    def from_prepared():
+        prepared.encrypt(jwc._des, jwc._get_deskey())
+
+    n = max(number // 20, 10)
+    before = _timeit(from_scratch, n) / n
+    after = _timeit(from_prepared, number) / number
+    print('prepared: from scratch %.1f us/attempt, prepared %.1f us/attempt (%.0fx)'
+          % (before * 1e6, after * 1e6, before / after))
+    return {'scratch_us': before * 1e6, 'prepared_us': after * 1e6}
+
+
+def _synthetic_table_page(rows, seed=2016):
+    """
+    DataTable.jsp-like page of elective courses
+    """
+    rnd = random.Random(seed)
+    weekdays = '一二三四五六日'
+    out = ['<html><head><title>DataTable</title></head><body>'
+           '<table id="tb" class="tableBorder"><thead><tr><th>课程</th><th>学分</th></tr></thead><tbody>']
+    for i in range(rows):
+        kcdm = '%010d' % rnd.randint(0, 9999999999)
+        cells = [
+            ('kc', '[%s]课程名称&amp;%d' % (kcdm, i)), ('kcdm', kcdm), ('skbjdm', '%s-%02d' % (kcdm, i % 20)),
+            ('kclb1', '%02d' % rnd.randint(0, 20)), ('kclb2', '%02d' % rnd.randint(0, 20)), ('khfs', '01'),
+            ('xf', '%.1f' % rnd.choice((1, 1.5, 2, 3))), ('zxs', str(rnd.choice((16, 32, 48)))),
+            ('rkjs', '[%05d]教师%d' % (rnd.randint(0, 99999), i % 300)), ('lb', '学校平台/通识教育模块/选修'),
+            ('sksj', '1-16周 %s[%d-%d]' % (rnd.choice(weekdays), 1 + i % 10, 2 + i % 10)),
+            ('skdd', '教八%03d' % rnd.randint(100, 999)), ('xxrs', '120'), ('yxrs', '%d/0' % rnd.randint(0, 120)),
+            ('kxrs', str(rnd.randint(0, 120))), ('xkfs', '学生网上选'), ('skfs', '理论'), ('skbj', '%02d' % (i % 20)),
+        ]
+        out.append('<tr class="%s" onmouseover="this.className=\'over\'">' % ('odd' if i % 2 else 'even'))
+        for name, value in cells:
+            out.append('<td name="%s" align="center" nowrap>%s</td>' % (name, value))
+        out.append('<td name="operation" align="center"><a href="javascript:void(0)" onclick="xk(%d)">选课</a></td>'
+                   '<td align="center">&nbsp;</td></tr>\n' % i)
+    out.append('</tbody></table></body></html>')
+    return ''.join(out)
+
+
+def bench_table_parser(rows=5000, number=3):
+    """
+    parse throughput of every DataTable.jsp parser, after checking they all agree
+    """
+    page = _synthetic_table_page(rows)
+    size = len(page.encode('utf-8'))
+    expected = None
+    results = {}
+    for name, cls in TABLE_PARSERS.items():
+        parser = cls()
+        parser.feed(page)
+        if expected is None:
+            expected = parser.courses
+        elif parser.courses != expected:
+            raise AssertionError('table parser %s differs from html' % name)
+
+        elapsed = _timeit(lambda: parser.feed(page), number) / number
+        print('table_parser[%s]: %d rows, %.0f rows/s, %.2f MB/s'
+              % (name, len(parser.courses), rows / elapsed, size / elapsed / 1e6))
+        results[name] = {'rows_per_sec': rows / elapsed, 'mb_per_sec': size / elapsed / 1e6}
+    return results
+
+
+def bench_course_memory(rows=10000):
+    """
+    memory held by a synthetic catalog as dict rows vs. Course rows
+    """
+    page = _synthetic_table_page(rows)
+    parser = TABLE_PARSERS['regex']()
+
+    gc.collect()
+    tracemalloc.start()
+    parser.feed(page)
+    dicts = parser.courses
+    parser.courses = []
+    gc.collect()
+    dict_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    gc.collect()
+    tracemalloc.start()
+    parser.feed(page)
+    courses = [Course.from_dict(x) for x in parser.courses]
+    parser.courses = []
+    gc.collect()
+    course_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    if courses != dicts or json.loads(json.dumps(courses, default=to_json)) != dicts \
+            or pickle.loads(pickle.dumps(courses)) != dicts:
+        raise AssertionError('Course rows differ from dict rows')
+    print('course_memory: %d rows, dict %.2f MB (%.0f B/row), Course %.2f MB (%.0f B/row)'
+          % (rows, dict_size / 1e6, dict_size / rows, course_size / 1e6, course_size / rows))
+    return {'dict_bytes_per_row': dict_size / rows, 'course_bytes_per_row': course_size / rows}
+
+
+def _print_summary(name, summary):
+    print('%s: n=%d mean %.2f ms, p50 %.2f ms, p90 %.2f ms, p99 %.2f ms, %.1f/s'
+          % (name, summary['count'], summary['mean_ms'], summary['p50_ms'], summary['p90_ms'],
+             summary['p99_ms'], summary['per_sec']))
+
+
+def bench_e2e(plan=200, elective=1000, wishlist=20, number=10, latency=0.0, rate_limit=20, evaluate_courses=30):
+    """
+    latency percentiles and throughput of whole workflows against a local MockServer
+    :param plan: planned courses in the synthetic catalog
+    :param elective: elective courses in the synthetic catalog
+    :param wishlist: courses grabbed by the grab loop
+    :param number: repetitions of each read
+    :param latency: seconds the server adds to every response
+    :param rate_limit: selections per second the server accepts
+    """
+    results = {}
+    with MockServer(plan_courses=plan, elective_courses=elective, latency=latency, rate_limit=rate_limit,
+                    evaluate_courses=evaluate_courses) as server:
+        def login():
+            BNUjwc(server.username, server.password, base_url=server.url).login()
+
+        jwc = BNUjwc(server.username, server.password, base_url=server.url, instrument=True)
+        jwc.login()
+        jwc.ready_for_threading(warm_select_info=True)
+        courses = jwc.get_elective_courses(True)
+
+        reads = [
+            ('login', login),
+            ('get_plan_courses', lambda: jwc.get_plan_courses(True)),
+            ('get_elective_courses', lambda: jwc.get_elective_courses(True)),
+            ('encrypt_params', lambda: jwc._encrypt_params(jwc.prepare_elective_course(courses[0]).params)),
+            ('get_exam_scores', jwc.get_exam_scores),
+        ]
+        for name, func in reads:
+            results[name] = _summary(_sample(func, number))
+            _print_summary('e2e[%s]' % name, results[name])
+
+        samples = []
+        submit_prepared = jwc.submit_prepared
+
+        def timed_submit(prepared):
+            start = time.perf_counter()
+            try:
+                return submit_prepared(prepared)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        jwc.submit_prepared = timed_submit
+        scheduler = GrabScheduler(jwc, interval=0.05, min_interval=0.001, increase=5, full_delay=0.1)
+        for x in random.Random(2016).sample(courses, min(wishlist, len(courses))):
+            scheduler.add_elective(x)
+        start = time.perf_counter()
+        tasks = scheduler.run(max_attempts=wishlist * 10)
+        elapsed = time.perf_counter() - start
+        del jwc.submit_prepared
+        results['grab'] = _summary(samples, elapsed)
+        results['grab'].update(wishlist=len(tasks), wall_s=elapsed, throttled=scheduler.stats['throttled'],
+                               done=sum(x.state == GrabScheduler.DONE for x in tasks))
+        _print_summary('e2e[grab]', results['grab'])
+
+        samples = []
+        start = time.perf_counter()
+        for evaluate in jwc.get_evaluate_list():
+            for course in jwc.get_evaluate_course_list(evaluate):
+                samples.extend(_sample(lambda: jwc.evaluate_course(evaluate, course), 1))
+        elapsed = time.perf_counter() - start
+        results['evaluate_serial'] = _summary(samples, elapsed)
+        results['evaluate_serial']['wall_s'] = elapsed
+        _print_summary('e2e[evaluate_serial]', results['evaluate_serial'])
+
+        server.state.evaluated.clear()
+        start = time.perf_counter()
+        items = [x for evaluate in jwc.get_evaluate_list() for x in jwc.evaluate_all(evaluate)]
+        elapsed = time.perf_counter() - start
+        results['evaluate_all'] = _summary([x['seconds'] for x in items], elapsed)
+        results['evaluate_all']['wall_s'] = elapsed
+        _print_summary('e2e[evaluate_all]', results['evaluate_all'])
+
+        results['server_requests'] = dict(server.state.requests)
+        results['stats'] = jwc.get_stats()
+    return results
+
+
+def bench_instrument(number=100000):
+    """
+    cost of one StatsRecorder phase, enabled and disabled
+    """
+    results = {}
+    for enabled in (False, True):
+        recorder = StatsRecorder(enabled)
+
+        def phase():
+            with recorder.phase('parse', 'table'):
+                pass
+
+        elapsed = _timeit(phase, number) / number
+        name = 'enabled' if enabled else 'disabled'
+        print('instrument[%s]: %.2f us/phase' % (name, elapsed * 1e6))
+        results[name + '_us'] = elapsed * 1e6
+    return results
+
+
+def _record_cassette(path, plan=200, elective=1000):
+    """
+    record every read of BNUjwc against a local MockServer
+    """
+    with MockServer(plan_courses=plan, elective_courses=elective) as server:
+        jwc = BNUjwc(server.username, server.password, base_url=server.url, record=path)
+        jwc.login()
+        for course in jwc.get_elective_courses()[:3]:
+            jwc.select_elective_course(course)
+        _replay_reads(jwc)
+        jwc.save_cassette()
+
+
+def _replay_reads(jwc):
+    """
+    :return: {name: result} of every parsed read
+    """
+    evaluate = jwc.get_evaluate_list()
+    return {
+        'plan': jwc.get_plan_courses(True),
+        'elective': jwc.get_elective_courses(True),
+        'cancel': jwc.get_cancel_courses(),
+        'result': jwc.get_selection_result(),
+        'scores': jwc.get_exam_scores(),
+        'evaluate': evaluate,
+        'evaluate_courses': [jwc.get_evaluate_course_list(x) for x in evaluate],
+    }
+
+
+def bench_replay(cassette=None, number=3):
+    """
+    parse every page of a cassette with every table parser, no network;
+    checks that all parsers agree, then reports time per full pass
+    :param cassette: recorded with BNUjwc(record=...), recorded from a MockServer if None
+    """
+    tmp = None
+    if cassette is None:
+        fd, tmp = tempfile.mkstemp(suffix='.cassette')
+        os.close(fd)
+        _record_cassette(tmp)
+        cassette = tmp
+    try:
+        results = {}
+        expected = None
+        for name in TABLE_PARSERS:
+            jwc = BNUjwc('', '', table_parser=name, replay=cassette)
+            reads = _replay_reads(jwc)
+            if expected is None:
+                expected = reads
+            elif reads != expected:
+                raise AssertionError('table parser %s differs on replayed pages' % name)
+
+            def one_pass():
+                jwc._cassette.rewind()
+                _replay_reads(jwc)
+
+            results[name] = _summary(_sample(one_pass, number))
+            _print_summary('replay[%s]' % name, results[name])
+        return results
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+
+def bench_timeouts(attempts=60, stall=0.05, stall_time=2.0):
+    """
+    grab loop tail latency against a server which stalls some responses,
+    without and with a selection timeout
+    """
+    results = {}
+    with MockServer(plan_courses=10, elective_courses=200, stall=stall, stall_time=stall_time) as server:
+        for name, submit_timeout in (('no_timeout', None), ('timeout', (1, 0.5))):
+            jwc = BNUjwc(server.username, server.password, base_url=server.url, submit_timeout=submit_timeout)
+            server.state.stall = 0
+            jwc.login()
+            jwc.ready_for_threading(warm_select_info=True)
+            courses = [x for x in jwc.get_elective_courses(True) if x['kxrs'] == '0']
+            server.state.stall = stall
+
+            samples = []
+            submit_prepared = jwc.submit_prepared
+
+            def timed_submit(prepared):
+                start = time.perf_counter()
+                try:
+                    return submit_prepared(prepared)
+                finally:
+                    samples.append(time.perf_counter() - start)
+
+            jwc.submit_prepared = timed_submit
+            # full courses, so every attempt is answered '人数已满' and retried
+            scheduler = GrabScheduler(jwc, interval=0.01, min_interval=0.005, full_delay=0)
+            for x in courses[:10]:
+                scheduler.add_elective(x)
+            start = time.perf_counter()
+            scheduler.run(max_attempts=attempts)
+            elapsed = time.perf_counter() - start
+            results[name] = _summary(samples, elapsed)
+            results[name].update(wall_s=elapsed, errors=scheduler.stats['errors'])
+            _print_summary('timeouts[%s]' % name, results[name])
+    return results
+
+
+def bench_decode(rows=5000, number=5):
+    """
+    cost of turning a large DataTable.jsp page into text when Content-Type names no charset:
+    r.text (detects the encoding of every page, or assumes ISO-8859-1 for text/*)
+    vs. BNUjwc's fast decode (site encoding learned once)
+    """
+    import requests
+
+    body = _synthetic_table_page(rows).encode('utf-8')
+    expected = body.decode('utf-8')
+
+    def response(content_type):
+        r = requests.Response()
+        r.status_code = 200
+        r.headers['Content-Type'] = content_type
+        # as HTTPAdapter.build_response does
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r._content = body
+        return r
+
+    jwc = BNUjwc('', '')
+    results = {}
+    for content_type in ('application/octet-stream', 'text/html'):
+        for name, fast_decode in (('r.text', False), ('fast_decode', True)):
+            jwc.fast_decode = fast_decode
+            jwc.encoding = None
+            jwc._text(response(content_type))
+            texts = []
+            elapsed = _timeit(lambda: texts.append(jwc._text(response(content_type))), number) / number
+            correct = texts[-1] == expected
+            print('decode[%s, %s]: %d KB page, %.2f ms%s' % (content_type, name, len(body) // 1024,
+                                                             elapsed * 1000, '' if correct else ', WRONG TEXT'))
+            results['%s %s' % (content_type, name)] = {'ms': elapsed * 1000, 'correct': correct}
+    return results
+
+
+def bench_parser_pool(rows=1000, workers=8, number=32):
+    """
+    parse one page from many threads through BNUjwc's parser pool; checks every
+    result, that parsers are reused and that no page data stays behind
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from mockserver import MockState
+
+    page = _synthetic_table_page(rows)
+    jwc = BNUjwc('', '')
+    with jwc._parser('table') as parser:
+        parser.feed(page)
+        expected = parser.courses
+
+    def parse(_):
+        with jwc._parser('table') as parser:
+            parser.feed(page)
+            return parser.courses
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        results = list(executor.map(parse, range(number)))
+    elapsed = time.perf_counter() - start
+    if any(x != expected for x in results):
+        raise AssertionError('concurrent parses differ')
+
+    pool = jwc._parsers['table']
+    with pool.acquire() as parser:
+        if parser.courses:
+            raise AssertionError('a pooled parser kept rows of an earlier page')
+
+    forms = MockState(plan_courses=2, elective_courses=0)
+    with jwc._parser('evaluate') as parser:
+        parser.feed(forms.evaluate_form('01'))
+        first = set(parser.select)
+    with jwc._parser('evaluate') as parser:
+        parser.feed(forms.evaluate_form('02'))
+        if parser.select & first:
+            raise AssertionError('evaluation form items leak into the next form')
+
+    print('parser_pool: %d parses on %d threads, %.1f pages/s, %d parsers created, %d idle'
+          % (number, workers, number / elapsed, pool.created, pool.idle()))
+    return {'pages_per_sec': number / elapsed, 'created': pool.created, 'idle': pool.idle()}
+
+
+def bench_stress(rounds=8, workers=8, plan=100, elective=200, latency=0.02, expire_at=3):
+    """
+    mixed reads through map_reads against a local MockServer, each worker thread on
+    its own session; checks every result against a serial run and that one expiry
+    of all sessions mid-run is healed by few re-logins shared through the cookie jar
+    """
+    with MockServer(plan_courses=plan, elective_courses=elective, latency=latency) as server:
+        jwc = BNUjwc(server.username, server.password, base_url=server.url, read_workers=workers)
+        jwc.login()
+        for x in jwc.get_elective_courses(True)[:3]:
+            jwc.select_elective_course(x)
+        calls = [
+            ('get_plan_courses', True),
+            ('get_elective_courses', True),
+            'get_cancel_courses',
+            'get_selection_result',
+            'get_exam_scores',
+            'get_exam_rounds',
+        ] * 2
+        start = time.perf_counter()
+        expected = [json.dumps(x, default=to_json, sort_keys=True) for x in jwc.map_reads(calls, workers=1)]
+        serial = time.perf_counter() - start
+
+        samples = []
+        start = time.perf_counter()
+        for i in range(rounds):
+            if i == expire_at:
+                server.state.expire_sessions()
+            t = time.perf_counter()
+            results = jwc.map_reads(calls, workers=workers)
+            samples.append(time.perf_counter() - t)
+            if [json.dumps(x, default=to_json, sort_keys=True) for x in results] != expected:
+                raise AssertionError('concurrent reads differ from serial reads in round %d' % i)
+        elapsed = time.perf_counter() - start
+        sessions = len(jwc._sessions)
+        jwc.close()
+
+    if jwc.relogin_count > 2:
+        raise AssertionError('%d re-logins for one expiry' % jwc.relogin_count)
+    result = _summary(samples)
+    result.update(reads_per_sec=rounds * len(calls) / elapsed, serial_reads_per_sec=len(calls) / serial,
+                  relogins=jwc.relogin_count, sessions=sessions)
+    _print_summary('stress[%d reads x %d rounds]' % (len(calls), rounds), result)
+    print('stress: %.1f reads/s on %d threads (%.1f serial), %d sessions, %d re-logins'
+          % (result['reads_per_sec'], workers, result['serial_reads_per_sec'], sessions, jwc.relogin_count))
+    return result
+
+
+def bench_singleflight(threads=16, rounds=5, elective=300, latency=0.05, ttl=0.5):
+    """
+    many threads reading the selection result and elective list at the same moment, against
+    a local MockServer: server requests and time per round without sharing, with in-flight
+    sharing and with a result cache of ttl seconds; checks that everyone gets the same rows
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = {}
+    with MockServer(plan_courses=50, elective_courses=elective, latency=latency) as server:
+        jwc = BNUjwc(server.username, server.password, base_url=server.url)
+        jwc.login()
+        for x in jwc.get_elective_courses(True)[:3]:
+            jwc.select_elective_course(x)
+        for name, cache_ttl in (('none', None), ('shared', 0), ('cached', ttl)):
+            jwc = BNUjwc(server.username, server.password, base_url=server.url, read_cache_ttl=cache_ttl or 0)
+            jwc.login()
+            jwc.ready_for_threading(warm_select_info=True)
+            expected = (jwc.get_selection_result(), jwc.get_elective_courses(True))
+            if cache_ttl is None:
+                jwc._flights.do = lambda key, func, cache=True: func()
+            reads = (jwc.get_selection_result, lambda: jwc.get_elective_courses(True))
+
+            before = sum(server.state.requests.values())
+            samples = []
+            with ThreadPoolExecutor(threads) as executor:
+                for _ in range(rounds):
+                    barrier = threading.Barrier(threads)
+
+                    def read(i):
+                        barrier.wait()
+                        return reads[i % 2]()
+
+                    start = time.perf_counter()
+                    got = list(executor.map(read, range(threads)))
+                    samples.append(time.perf_counter() - start)
+                    if any(x != expected[i % 2] for i, x in enumerate(got)):
+                        raise AssertionError('%s: a thread got different rows' % name)
+            requests_sent = sum(server.state.requests.values()) - before
+            results[name] = _summary(samples)
+            results[name].update(requests=requests_sent, reads=threads * rounds, **jwc.get_read_stats())
+            _print_summary('singleflight[%s]' % name, results[name])
+            print('singleflight[%s]: %d server requests for %d reads' % (name, requests_sent, threads * rounds))
+            jwc.close()
+    return results
+
+
+def bench_conflicts(plan=200, elective=1000, pairs=20000, number=3):
+    """
+    all-pairs time conflict matrix over every section of a synthetic catalog, with
+    mask parsing on a cold cache, checked against comparing (week, weekday, period) sets
+    on random pairs; and single conflict checks against a timetable of selected courses
+    """
+    rows = [{'skbjdm': x['skbjdm'], 'sksjdd': x['sksjdd']}
+            for course in synthetic_courses(plan, elective) for x in course['sections']]
+    rows += [{'skbjdm': 'sample-%d' % i, 'sksjdd': text} for i, text in enumerate(
+        ('1-15单周 一[1-2] 三[3-4] 七107', '2-16双周 一[1-2] 八111', '1-8周 二[5-6] 八111 9-16周 五[5-6] 四203'))]
+
+    def parse():
+        schedule_mask.cache_clear()
+        return [course_mask(x) for x in rows]
+
+    parse_time = _timeit(parse, number) / number
+    matrix_time = _timeit(lambda: conflict_matrix(rows), number) / number
+    matrix = conflict_matrix(rows)
+
+    def slots(x):
+        return {(week, weekday, period) for weeks, weekday, first, last in parse_schedule(x['sksjdd'])
+                for week in weeks for period in range(first, last + 1)}
+
+    rnd = random.Random(2016)
+    for _ in range(pairs):
+        i, j = rnd.randrange(len(rows)), rnd.randrange(len(rows))
+        if i != j and bool(matrix[i] >> j & 1) != bool(slots(rows[i]) & slots(rows[j])):
+            raise AssertionError('conflict of %r and %r is wrong' % (rows[i]['sksjdd'], rows[j]['sksjdd']))
+
+    timetable = Timetable(rnd.sample(rows, 8))
+    check_time = _timeit(lambda: [timetable.conflicts(x) for x in rows], number) / number
+    conflicts = sum(bin(x).count('1') for x in matrix) // 2
+    result = {
+        'sections': len(rows), 'distinct_schedules': len(set(course_mask(x) for x in rows)),
+        'conflicting_pairs': conflicts, 'parse_ms': parse_time * 1000, 'matrix_ms': matrix_time * 1000,
+        'check_us': check_time / len(rows) * 1e6,
+    }
+    print('conflicts: %d sections (%d schedules), parse %.1f ms, matrix %.1f ms (%d conflicting pairs), '
+          '%.2f us per timetable check' % (result['sections'], result['distinct_schedules'], result['parse_ms'],
+                                           result['matrix_ms'], conflicts, result['check_us']))
+    return result
+
+
+BENCHMARKS = {
+    'des': bench_des,
+    'prepared': bench_prepared,
+    'table_parser': bench_table_parser,
+    'course_memory': bench_course_memory,
+    'e2e': bench_e2e,
+    'instrument': bench_instrument,
+    'replay': bench_replay,
+    'timeouts': bench_timeouts,
+    'decode': bench_decode,
+    'parser_pool': bench_parser_pool,
+    'stress': bench_stress,
+    'singleflight': bench_singleflight,
+    'conflicts': bench_conflicts,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmarks for BNU-Schoolwork-Assist')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.names or list(BENCHMARKS):
+        results[name] = BENCHMARKS[name]()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
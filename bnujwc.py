@@ -1,16 +1,44 @@
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import contextlib
+import codecs
 import re
 import hashlib
+import html
 import urllib
 import base64
-from datetime import datetime
+import gzip
+import atexit
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import xml.etree.cElementTree as etree
 from html.parser import HTMLParser
-import execjs
 import random
 import json
-from multiprocessing import Process
+import sys
+import bisect
+import heapq
+import itertools
+import sqlite3
+import zlib
+from collections.abc import Mapping
+import threading
 import time
+import weakref
+from types import MappingProxyType
+from des import get_des_engine
+
+
+def freeze(info):
+    """
+    :return: read-only view of a copy of info, safe to share between threads
+    """
+    return MappingProxyType(dict(info))
 
 
 class LoginError(Exception):
@@ -21,47 +49,779 @@ class LoginError(Exception):
         return repr(self.value)
 
 
-class TableHTMLParser(HTMLParser):
-    def __init__(self):
-        self.start_td = self.start_tr = False
+class PasswordError(LoginError):
+    """
+    wrong username or password, retrying does not help
+    """
+
+
+class Course(Mapping):
+    """
+    compact read-only course row
+
+    Rows with the same columns share one interned key index, values are kept
+    in an interned tuple.  It behaves like the dict it was built from
+    (course['kcdm'], course.get(), items(), == dict, dict(course)).
+    """
+    __slots__ = ('_index', '_values')
+
+    _indexes = {}
+
+    def __init__(self, fields, values):
+        """
+        :param fields: tuple of keys
+        :param values: values in the same order
+        """
+        index = Course._indexes.get(fields)
+        if index is None:
+            index = {sys.intern(k): i for i, k in enumerate(fields)}
+            Course._indexes[fields] = index
+        self._index = index
+        self._values = tuple(sys.intern(v) if type(v) is str else v for v in values)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(tuple(d), d.values())
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def to_dict(self):
+        return dict(zip(self._index, self._values))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return Course, (tuple(self._index), self._values)
+
+
+def to_json(o):
+    """
+    json.dumps default for Course rows and frozen info
+    """
+    if isinstance(o, Course):
+        return o.to_dict()
+    if isinstance(o, MappingProxyType):
+        return dict(o)
+    raise TypeError('%r is not JSON serializable' % o)
+
+
+_weekday_map = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '日': 7, '天': 7, '七': 7}
+_code_prefix_re = re.compile(r'^\s*\[[^\]]*\]\s*')
+
+
+# bits per day and weeks assumed for sessions without weeks, see schedule_mask
+PERIODS = 16
+WEEKS = 20
+_schedule_re = re.compile(r'(\d+(?:-\d+)?(?:[,，、]\d+(?:-\d+)?)*)\s*([单双])?周'
+                          r'|([一二三四五六日天七])\s*\[(\d+)(?:-(\d+))?\]')
+
+
+def _parse_weeks(text, parity=None):
+    weeks = []
+    for part in re.split('[,，、]', text):
+        first, _, last = part.partition('-')
+        weeks.extend(range(int(first), int(last or first) + 1))
+    if parity == '单':
+        weeks = [x for x in weeks if x % 2]
+    elif parity == '双':
+        weeks = [x for x in weeks if not x % 2]
+    return tuple(weeks)
+
+
+def parse_schedule(text):
+    """
+    parse weeks, weekday and periods of every session of a schedule string,
+    weeks apply to the sessions after them, all WEEKS weeks if none are given
+    :param text: e.g. '1-16周 四[9-10] 八111(62)', '1-15单周 一[1-2] 三[3-4] 七107',
+                 '1-8周 二[5-6] 八111 9-16周 五[5-6] 四203' or '1-16\xa0周四[9-10]\xa0八111'
+    :return: [(weeks, weekday, first period, last period), ...] e.g. [((1, 2, ..., 16), 4, 9, 10)]
+    """
+    sessions = []
+    weeks = tuple(range(1, WEEKS + 1))
+    for m in _schedule_re.finditer(text or ''):
+        if m.group(1):
+            weeks = _parse_weeks(m.group(1), m.group(2))
+        else:
+            first = int(m.group(4))
+            sessions.append((weeks, _weekday_map[m.group(3)], first, int(m.group(5) or first)))
+    return sessions
+
+
+def parse_timeslots(text):
+    """
+    parse weekday and periods of a schedule string, leaving out weeks, see parse_schedule
+    :param text: e.g. '1-16周 四[9-10] 八111(62)'
+    :return: [(weekday, first period, last period), ...] e.g. [(4, 9, 10)]
+    """
+    return [(weekday, first, last) for weeks, weekday, first, last in parse_schedule(text)]
+
+
+@functools.lru_cache(maxsize=4096)
+def schedule_mask(text):
+    """
+    week x weekday x period bitmask of a schedule string, two schedules overlap when their masks AND to non zero
+    bit ((week - 1) * 7 + weekday - 1) * PERIODS + period - 1 is set for every period taken
+    :param text: schedule string, see parse_schedule
+    :return: int
+    """
+    mask = 0
+    for weeks, weekday, first, last in parse_schedule(text):
+        first, last = max(first, 1), min(last, PERIODS)
+        if first > last:
+            continue
+        day = ((1 << (last - first + 1)) - 1) << ((weekday - 1) * PERIODS + first - 1)
+        for week in weeks:
+            mask |= day << (week - 1) * 7 * PERIODS
+    return mask
+
+
+def course_mask(course):
+    """
+    :param course: course row with 'sksjdd' or 'sksj' (course lists) or '上课时间地点' (selection result)
+    :return: schedule bitmask, see schedule_mask
+    """
+    return schedule_mask(course.get('sksjdd') or course.get('sksj') or course.get('上课时间地点') or '')
+
+
+def conflict_matrix(courses):
+    """
+    all pairs of courses overlapping in time
+    :param courses: course rows
+    :return: one int per course, bit j of row i is set when courses i and j overlap
+    """
+    masks = [course_mask(x) for x in courses]
+    # many sections share a schedule, compare each distinct schedule once
+    groups = {}
+    for i, mask in enumerate(masks):
+        if mask:
+            groups[mask] = groups.get(mask, 0) | 1 << i
+    distinct = list(groups.items())
+    overlaps = {}
+    for a, (mask_a, rows_a) in enumerate(distinct):
+        # a schedule always overlaps itself
+        overlaps[mask_a] = overlaps.get(mask_a, 0) | rows_a
+        for mask_b, rows_b in distinct[a + 1:]:
+            if mask_a & mask_b:
+                overlaps[mask_a] |= rows_b
+                overlaps[mask_b] = overlaps.get(mask_b, 0) | rows_a
+    return [overlaps[mask] & ~(1 << i) if mask else 0 for i, mask in enumerate(masks)]
+
+
+def _course_name(course):
+    return course.get('skbjdm') or course.get('课程代码') or course.get('kcdm') or course.get('kc') or ''
+
+
+class Timetable:
+    """
+    periods taken by a set of courses
+
+    Keeps the schedule_mask of every course and their union, so whether a
+    course fits is one AND however many courses there are.
+
+        timetable = jwc.get_timetable()
+        if not timetable.conflicts(course):
+            timetable.add(course)
+    """
+    def __init__(self, courses=()):
+        self.mask = 0
+        self._masks = {}
+        for course in courses:
+            self.add(course)
+
+    @staticmethod
+    def _mask(course):
+        return course if isinstance(course, int) else course_mask(course)
+
+    def add(self, course, name=None):
+        """
+        :param course: course row or schedule bitmask
+        :param name: key of the course, its skbjdm / 课程代码 by default
+        :return: schedule bitmask of the course
+        """
+        mask = self._mask(course)
+        if name is None:
+            name = _course_name(course) if not isinstance(course, int) else str(len(self._masks))
+        replaced = name in self._masks
+        self._masks[name] = mask
+        if replaced:
+            self._union()
+        else:
+            self.mask |= mask
+        return mask
+
+    def remove(self, name):
+        """
+        :param name: key given to add
+        """
+        if self._masks.pop(name, None) is not None:
+            self._union()
+
+    def _union(self):
+        self.mask = functools.reduce(int.__or__, self._masks.values(), 0)
+
+    def conflicts(self, course):
+        """
+        :param course: course row or schedule bitmask
+        :return: whether it overlaps any course of the timetable
+        """
+        return bool(self._mask(course) & self.mask)
+
+    def conflicting(self, course):
+        """
+        :param course: course row or schedule bitmask
+        :return: names of the courses it overlaps
+        """
+        mask = self._mask(course)
+        if not mask & self.mask:
+            return []
+        return [name for name, x in self._masks.items() if x & mask]
+
+    def __contains__(self, name):
+        return name in self._masks
+
+    def __len__(self):
+        return len(self._masks)
+
+
+def strip_code(name):
+    """
+    '[0410036171]跨文化交际英语课程' -> '跨文化交际英语课程'
+    """
+    return _code_prefix_re.sub('', name or '')
+
+
+class CourseCatalog:
+    """
+    in-memory course catalog indexed by kcdm, skbjdm, teacher, category and timeslot,
+    with prefix and substring search over course names
+    """
+    def __init__(self, courses=(), source=''):
         self.courses = []
-        self.course = {}
+        self.sources = []
+        self._by_source = {}
+        self._by_kcdm = {}
+        self._by_skbjdm = {}
+        self._by_teacher = {}
+        self._by_category = {}
+        self._by_timeslot = {}
+        self._names = []
+        self._prefix = []
+        self._bigrams = {}
+        self.extend(courses, source)
+
+    @staticmethod
+    def _add_index(index, key, i):
+        if key:
+            index.setdefault(key, []).append(i)
+
+    def add(self, course, source=''):
+        """
+        :param course: course row from get_plan_courses / get_elective_courses
+        :param source: where the row comes from, e.g. 'plan' or 'elective'
+        """
+        i = len(self.courses)
+        self.courses.append(course)
+        self.sources.append(source)
+
+        self._add_index(self._by_source, source, i)
+        self._add_index(self._by_kcdm, course.get('kcdm'), i)
+        self._add_index(self._by_skbjdm, course.get('skbjdm'), i)
+        self._add_index(self._by_teacher, strip_code(course.get('rkjs')), i)
+        self._add_index(self._by_category, course.get('lb'), i)
+        for weekday, first, last in parse_timeslots(course.get('sksjdd') or course.get('sksj')):
+            for period in range(first, last + 1):
+                self._add_index(self._by_timeslot, (weekday, period), i)
+
+        name = strip_code(course.get('kc')).lower()
+        self._names.append(name)
+        bisect.insort(self._prefix, (name, i))
+        for bigram in {name[j:j + 2] for j in range(len(name) - 1)}:
+            self._bigrams.setdefault(bigram, set()).add(i)
+
+    def extend(self, courses, source=''):
+        for course in courses:
+            self.add(course, source)
+
+    def __len__(self):
+        return len(self.courses)
+
+    def __iter__(self):
+        return iter(self.courses)
+
+    def _rows(self, ids):
+        return [self.courses[i] for i in ids]
+
+    def source_of(self, course):
+        """
+        :return: source given when course was added
+        """
+        for i in self._by_skbjdm.get(course.get('skbjdm'), ()) or self._by_kcdm.get(course.get('kcdm'), ()):
+            if self.courses[i] is course or self.courses[i] == course:
+                return self.sources[i]
+        return None
+
+    def by_source(self, source):
+        return self._rows(self._by_source.get(source, ()))
+
+    def by_kcdm(self, kcdm):
+        return self._rows(self._by_kcdm.get(kcdm, ()))
+
+    def by_skbjdm(self, skbjdm):
+        return self._rows(self._by_skbjdm.get(skbjdm, ()))
+
+    def by_teacher(self, name):
+        """
+        :param name: teacher name, with or without '[code]'
+        """
+        return self._rows(self._by_teacher.get(strip_code(name), ()))
+
+    def by_category(self, lb):
+        """
+        :param lb: classification or a prefix of it, e.g. '学校平台/大学外语模块'
+        """
+        ids = []
+        for key, rows in self._by_category.items():
+            if key.startswith(lb):
+                ids.extend(rows)
+        return self._rows(sorted(ids))
+
+    def by_timeslot(self, weekday, period):
+        """
+        :param weekday: 1 (Monday) ~ 7 (Sunday)
+        :param period: class period number
+        """
+        return self._rows(self._by_timeslot.get((weekday, period), ()))
+
+    def prefix(self, text):
+        """
+        courses whose name (without code) starts with text
+        """
+        text = text.lower()
+        start = bisect.bisect_left(self._prefix, (text,))
+        ids = []
+        for name, i in self._prefix[start:]:
+            if not name.startswith(text):
+                break
+            ids.append(i)
+        return self._rows(sorted(ids))
+
+    def search(self, text):
+        """
+        courses whose name (without code) contains text
+        """
+        text = text.lower()
+        if len(text) < 2:
+            return self._rows(i for i, name in enumerate(self._names) if text in name)
+        ids = None
+        for bigram in {text[j:j + 2] for j in range(len(text) - 1)}:
+            posting = self._bigrams.get(bigram, set())
+            ids = posting if ids is None else ids & posting
+            if not ids:
+                return []
+        return self._rows(i for i in sorted(ids) if text in self._names[i])
+
+    def find(self, text):
+        """
+        look up by kcdm, skbjdm, teacher or name
+        """
+        for rows in (self.by_skbjdm(text), self.by_kcdm(text), self.by_teacher(text)):
+            if rows:
+                return rows
+        return self.search(text)
+
+
+class SnapshotStore:
+    """
+    on-disk snapshots of parsed data (catalogs, student info, select info)
+
+    one SQLite table of zlib compressed JSON blobs keyed by (kind, key)
+    """
+    def __init__(self, path='snapshot.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS snapshot ('
+                               'kind TEXT NOT NULL, key TEXT NOT NULL, updated REAL NOT NULL, data BLOB NOT NULL, '
+                               'PRIMARY KEY (kind, key))')
+
+    def get(self, kind, key):
+        """
+        :return: (updated timestamp, value), None if not stored
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT updated, data FROM snapshot WHERE kind = ? AND key = ?',
+                                     (kind, key)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    def put(self, kind, key, value, updated=None):
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':'),
+                                        default=to_json).encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO snapshot (kind, key, updated, data) VALUES (?, ?, ?, ?)',
+                               (kind, key, time.time() if updated is None else updated, data))
+
+    def delete(self, kind=None, key=None):
+        """
+        delete snapshots of kind (and key), all if kind is None
+        """
+        with self._lock, self._conn:
+            if kind is None:
+                self._conn.execute('DELETE FROM snapshot')
+            elif key is None:
+                self._conn.execute('DELETE FROM snapshot WHERE kind = ?', (kind,))
+            else:
+                self._conn.execute('DELETE FROM snapshot WHERE kind = ? AND key = ?', (kind, key))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """
+    replayed request which is not in the cassette
+    """
+
+
+class Cassette:
+    """
+    recorded request / response pairs, gzip compressed JSON
+
+    Requests are matched by method, path, query and form body, leaving out
+    values that change on every call (random=, dateTime=, lt, execution and
+    the encrypted params / token / timestamp).  Repeated requests are served
+    in recorded order, the last answer is repeated when they run out.
+    Every secret (username, password) is replaced by a placeholder in both
+    requests and responses, and cookie values are dropped.  Bodies which are
+    not UTF-8 are redacted as bytes in their charset, the site encoding and
+    the usual Chinese encodings before they are kept as base64.
+    """
+    version = 1
+    _volatile = frozenset(('random', 'dateTime', 'lt', 'execution', 'params', 'token', 'timestamp'))
+    _cookie_re = re.compile(r'(\w+)=[^;,\s]*')
+    _encodings = ('gb18030', 'big5')
+
+    def __init__(self, path, mode='replay', secrets=None, encoding=None):
+        """
+        :param path: cassette file
+        :param mode: 'record' (pass through and keep) or 'replay' (no network at all)
+        :param secrets: {placeholder: value}, e.g. {'__username__': '2014...', '__password__': '...'}
+        :param encoding: site encoding, tried first for bodies which are not UTF-8
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError('mode must be record or replay')
+        self.path = path
+        self.mode = mode
+        self.encoding = encoding
+        self.secrets = {}
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._index = {}
+        self._played = {}
+        for placeholder, value in (secrets or {}).items():
+            self.add_secret(placeholder, value)
+        if mode == 'replay':
+            self.load()
+
+    def add_secret(self, placeholder, value):
+        if value:
+            self.secrets[placeholder] = str(value)
+
+    def _secrets(self):
+        # longest first, so a password containing the username is still hidden
+        for placeholder, value in sorted(self.secrets.items(), key=lambda x: -len(x[1])):
+            yield placeholder, value
+            quoted = urllib.parse.quote_plus(value)
+            if quoted != value:
+                yield placeholder, quoted
+
+    def _redact(self, text):
+        for placeholder, value in self._secrets():
+            text = text.replace(value, placeholder)
+        return text
+
+    def _redact_bytes(self, content, charset=None):
+        encodings = []
+        for name in (charset, self.encoding) + Cassette._encodings:
+            try:
+                name = codecs.lookup(name).name if name else None
+            except LookupError:
+                continue
+            if name and name not in encodings:
+                encodings.append(name)
+        for placeholder, value in self._secrets():
+            for encoding in encodings:
+                try:
+                    secret = value.encode(encoding)
+                except UnicodeEncodeError:
+                    continue
+                content = content.replace(secret, placeholder.encode(encoding))
+        return content
+
+    def key(self, method, url, body):
+        """
+        :return: text identifying a request across runs
+        """
+        parts = urllib.parse.urlsplit(url)
+        query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+                 if k not in Cassette._volatile]
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        form = [(k, v) for k, v in urllib.parse.parse_qsl(body or '', keep_blank_values=True)
+                if k not in Cassette._volatile]
+        return self._redact('%s %s?%s %s' % (method, parts.path, urllib.parse.urlencode(query),
+                                             urllib.parse.urlencode(sorted(form))))
+
+    def record(self, request, response):
+        headers = []
+        for name, value in response.headers.items():
+            if name.lower() == 'set-cookie':
+                value = Cassette._cookie_re.sub(r'\1=', value)
+            headers.append([name, self._redact(value)])
+        content = response.content
+        try:
+            body, binary = self._redact(content.decode('utf-8')), False
+        except UnicodeDecodeError:
+            content = self._redact_bytes(content, get_encoding_from_headers(response.headers))
+            body, binary = base64.b64encode(content).decode('ascii'), True
+        with self._lock:
+            self.interactions.append({
+                'key': self.key(request.method, request.url, request.body),
+                'status': response.status_code,
+                'reason': response.reason,
+                'headers': headers,
+                'body': body,
+                'binary': binary,
+            })
+
+    def play(self, request):
+        """
+        :return: recorded interaction answering request
+        """
+        key = self.key(request.method, request.url, request.body)
+        with self._lock:
+            found = self._index.get(key)
+            if not found:
+                raise CassetteMiss('not in cassette: ' + key)
+            i = self._played.get(key, 0)
+            self._played[key] = i + 1
+            return found[min(i, len(found) - 1)]
+
+    def rewind(self):
+        with self._lock:
+            self._played = {}
+
+    def load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        self.interactions = data['interactions']
+        self._index = {}
+        for x in self.interactions:
+            self._index.setdefault(x['key'], []).append(x)
+        self._played = {}
+
+    def save(self, path=None):
+        with self._lock:
+            data = {'version': Cassette.version, 'interactions': list(self.interactions)}
+        with gzip.open(path or self.path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    transport adapter recording to or replaying from a Cassette
+    """
+    def __init__(self, cassette, **kwargs):
+        self.cassette = cassette
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        if self.cassette.mode == 'replay':
+            return self._build(request, self.cassette.play(request))
+        r = HTTPAdapter.send(self, request, stream=stream, **kwargs)
+        self.cassette.record(request, r)
+        return r
+
+    def _build(self, request, interaction):
+        r = requests.Response()
+        r.status_code = interaction['status']
+        r.reason = interaction['reason']
+        r.headers = CaseInsensitiveDict(interaction['headers'])
+        body = interaction['body']
+        r._content = base64.b64decode(body) if interaction['binary'] else body.encode('utf-8')
+        r._content_consumed = True
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r.elapsed = timedelta(0)
+        return r
+
 
+class TableHTMLParser(HTMLParser):
+    def __init__(self):
         HTMLParser.__init__(self)
 
-    def feed(self, data):
+    def reset(self):
+        """
+        drop all state and parsed rows
+        """
+        HTMLParser.reset(self)
         self.start_td = self.start_tr = False
+        self.in_data = False
         self.courses = []
         self.course = {}
+
+    def feed(self, data):
+        self.reset()
         HTMLParser.feed(self, data)
 
+    def begin(self):
+        """
+        start an incremental parse, then call feed_chunk and pop_courses
+        """
+        self.reset()
+
+    def feed_chunk(self, data):
+        HTMLParser.feed(self, data)
+
+    def pop_courses(self):
+        """
+        :return: rows completed since last call
+        """
+        courses, self.courses = self.courses, []
+        return courses
+
     def handle_starttag(self, tag, attrs):
+        self.in_data = False
         if tag == 'tr':
             self.start_tr = True
+            self.start_td = False
         elif tag == 'td' and self.start_tr:
+            # a cell without a name also ends a named cell whose </td> is omitted
+            self.start_td = False
             for k, v in attrs:
                 if k == 'name':
                     self.start_td = v
                     break
-                else:
-                    self.start_td = False
 
     def handle_endtag(self, tag):
+        self.in_data = False
         if tag == 'tr':
             if len(self.course):
                 self.courses.append(self.course)
                 self.course = {}
-            self.start_tr = False
+            self.start_tr = self.start_td = False
         elif tag == 'td':
             self.start_td = False
 
     def handle_data(self, data):
         if self.start_td:
-            self.course[self.start_td] = data
+            # a text node may arrive in pieces when fed chunk by chunk
+            if self.in_data:
+                self.course[self.start_td] += data
+            else:
+                self.course[self.start_td] = data
+            self.in_data = True
+
+
+class TableRegexParser:
+    """
+    drop-in replacement of TableHTMLParser for the DataTable.jsp markup,
+    scanning rows and named cells with compiled regexes instead of a
+    callback per tag / text node
+
+    Like HTMLParser it skips comments, ends a cell without </td> at the next
+    <td, <tr or </tr>, and merges rows whose </tr> is omitted into the next row.
+    """
+    _comment_re = re.compile(r'<!--.*?-->', re.S)
+    _row_re = re.compile(r'<tr\b[^>]*>(.*?)</tr\s*>', re.S | re.I)
+    _td_re = re.compile(r'<td\b([^>]*)>(.*?)(?=</td\s*>|<td\b|</?tr\b|\Z)', re.S | re.I)
+    _name_re = re.compile(r'(?:^|\s)name\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))', re.I)
+    _tag_re = re.compile(r'<[^>]*>')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.courses = []
+        self.rawdata = ''
+
+    def _parse_rows(self, data):
+        courses = []
+        for row in self._row_re.finditer(self._comment_re.sub('', data)):
+            course = {}
+            for td in self._td_re.finditer(row.group(1)):
+                m = self._name_re.search(td.group(1))
+                if not m:
+                    continue
+                name = m.group(1) or m.group(2) or m.group(3)
+                if not name:
+                    continue
+                # like TableHTMLParser, keep the last text node of the cell
+                for text in reversed(self._tag_re.split(td.group(2))):
+                    if text:
+                        course[html.unescape(name)] = html.unescape(text)
+                        break
+            if course:
+                courses.append(course)
+        return courses
+
+    def feed(self, data):
+        self.rawdata = ''
+        self.courses = self._parse_rows(data)
+
+    def begin(self):
+        self.reset()
+
+    def feed_chunk(self, data):
+        self.rawdata += data
+        # a </tr> inside a comment does not end a row, nor does one after a comment still open
+        scan = self._comment_re.sub(lambda m: ' ' * len(m.group()), self.rawdata)
+        opened = scan.find('<!--')
+        end = scan.rfind('</tr', 0, len(scan) if opened == -1 else opened)
+        end = scan.find('>', end) if end != -1 else -1
+        if end != -1:
+            self.courses.extend(self._parse_rows(self.rawdata[:end + 1]))
+            self.rawdata = self.rawdata[end + 1:]
+
+    def pop_courses(self):
+        courses, self.courses = self.courses, []
+        return courses
+
+    def close(self):
+        pass
+
+
+TABLE_PARSERS = {
+    'html': TableHTMLParser,
+    'regex': TableRegexParser,
+}
 
 
 class ResultHTMLParser(HTMLParser):
     def __init__(self):
+        HTMLParser.__init__(self)
+
+    def reset(self):
+        """
+        drop all state and parsed tables
+        """
+        HTMLParser.reset(self)
         self.start_table = self.start_thead = self.start_td = self.start_tr = False
         self.tables = []
         self.table = []
@@ -69,14 +829,8 @@ class ResultHTMLParser(HTMLParser):
         self.data = ''
         self.noskip = False
 
-        HTMLParser.__init__(self)
-
     def feed(self, data, noskip = False):
-        self.start_table = self.start_thead = self.start_td = self.start_tr = False
-        self.tables = []
-        self.table = []
-        self.tr = []
-        self.data = ''
+        self.reset()
         self.noskip = noskip
         HTMLParser.feed(self, data)
 
@@ -119,11 +873,19 @@ class ResultHTMLParser(HTMLParser):
 
 class EvaluateHTMLParser(HTMLParser):
     def __init__(self):
+        HTMLParser.__init__(self)
+
+    def reset(self):
+        """
+        drop all state and the items of the last form
+        """
+        HTMLParser.reset(self)
         self.select = set()
         self.text = set()
-        HTMLParser.__init__(self)
 
     def feed(self, data, noskip = False):
+        # one form per feed, items of an earlier form must not leak in
+        self.reset()
         HTMLParser.feed(self, data)
 
     def handle_starttag(self, tag, attrs):
@@ -147,6 +909,403 @@ class EvaluateHTMLParser(HTMLParser):
         pass
 
 
+class ParserPool:
+    """
+    parsers of one class for concurrent use
+
+    acquire() hands out a parser no other thread holds and resets it when
+    it comes back, so no page outlives the call and nothing is locked while
+    parsing.  At most max_idle parsers are kept for reuse.
+
+        with pool.acquire() as parser:
+            parser.feed(text)
+            rows = parser.courses
+    """
+    def __init__(self, cls, max_idle=4):
+        self.cls = cls
+        self.max_idle = max_idle
+        self.created = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self._lock:
+            parser = self._idle.pop() if self._idle else None
+            if parser is None:
+                self.created += 1
+        if parser is None:
+            parser = self.cls()
+        try:
+            yield parser
+        finally:
+            parser.reset()
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(parser)
+
+    def idle(self):
+        """
+        :return: number of parsers waiting for reuse
+        """
+        return len(self._idle)
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    share one call among threads asking for the same key at the same time
+
+    The first caller of a key runs func, callers arriving while it runs wait
+    and get its result (or its exception) instead of running func again.
+    With ttl > 0 a result is also kept for ttl seconds.  forget() drops kept
+    results and detaches running calls, so nothing fetched before a write is
+    handed out after it.
+
+        rows = flights.do(('table', table_id, data), fetch)
+    """
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self._flights = {}
+        self._results = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'call': 0, 'shared': 0, 'cached': 0}
+
+    def do(self, key, func, cache=True):
+        """
+        :param key: hashable key of the call
+        :param func: function without arguments doing the call
+        :param cache: accept a result kept from an earlier call
+        :return: result of func
+        """
+        with self._lock:
+            if cache and self.ttl and key in self._results:
+                stored, result = self._results[key]
+                if time.monotonic() - stored < self.ttl:
+                    self._stats['cached'] += 1
+                    return result
+                del self._results[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                self._stats['call'] += 1
+            else:
+                self._stats['shared'] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.error is None and self.ttl and generation == self._generation:
+                    self._results[key] = (time.monotonic(), flight.result)
+            flight.done.set()
+        return flight.result
+
+    def forget(self, match=None):
+        """
+        drop kept results and detach running calls
+        :param match: function telling which keys to drop, all if None
+        """
+        with self._lock:
+            self._generation += 1
+            for d in (self._results, self._flights):
+                for key in [k for k in d if match is None or match(k)]:
+                    del d[key]
+
+    def stats(self):
+        """
+        :return: {'call': 0, 'shared': 0, 'cached': 0}, calls run, joined and answered from kept results
+        """
+        return dict(self._stats)
+
+
+class _Phase:
+    """
+    one timed phase of StatsRecorder, set size before leaving to count bytes
+    """
+    __slots__ = ('recorder', 'kind', 'name', 'size', 'start')
+
+    def __init__(self, recorder, kind, name):
+        self.recorder = recorder
+        self.kind = kind
+        self.name = name
+        self.size = 0
+
+    def __enter__(self):
+        for hook in self.recorder.hooks:
+            hook('start', self.kind, self.name, None)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.recorder.record(self.kind, self.name, seconds, self.size)
+        for hook in self.recorder.hooks:
+            hook('end', self.kind, self.name, seconds)
+
+
+class _NullPhase:
+    __slots__ = ('size',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class StatsRecorder:
+    """
+    request counts, latency histograms and byte counts per endpoint,
+    and time spent per parse / encrypt phase
+
+        with recorder.phase('parse', 'table'):
+            parser.feed(text)
+
+    A disabled recorder hands out a no-op phase.  Trace hooks are called as
+    hook(event, kind, name, seconds) with event 'start' (seconds None) and 'end'.
+    """
+    # upper bounds of the histogram buckets: 1ms, 2ms, 4ms ... 32s, the last bucket is unbounded
+    bounds = tuple(0.001 * 2 ** i for i in range(16))
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._null = _NullPhase()
+
+    def phase(self, kind, name):
+        """
+        :param kind: 'http', 'parse', 'encrypt' ...
+        :param name: endpoint or parser name
+        :return: context manager timing the phase
+        """
+        if not self.enabled:
+            return self._null
+        return _Phase(self, kind, name)
+
+    def record(self, kind, name, seconds, size=0):
+        bucket = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            entry = self._stats.get((kind, name))
+            if entry is None:
+                entry = self._stats[(kind, name)] = [0, 0.0, seconds, seconds, 0, [0] * (len(self.bounds) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds < entry[2]:
+                entry[2] = seconds
+            if seconds > entry[3]:
+                entry[3] = seconds
+            entry[4] += size
+            entry[5][bucket] += 1
+
+    def _percentile(self, buckets, count, p):
+        rank = p * count
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] * 1000 if i < len(self.bounds) else float('inf')
+        return 0.0
+
+    def stats(self):
+        """
+        :return: {kind: {name: {
+            'count': 3, 'total_ms': 0.0, 'mean_ms': 0.0, 'min_ms': 0.0, 'max_ms': 0.0,
+            'bytes': 0, 'p50_ms': 0.0, 'p90_ms': 0.0, 'p99_ms': 0.0, # upper bound of the bucket
+            'histogram': [count per bucket of StatsRecorder.bounds, ..., count above the last bound]
+        }}}
+        """
+        with self._lock:
+            items = [(key, list(entry[:5]) + [list(entry[5])]) for key, entry in self._stats.items()]
+        result = {}
+        for (kind, name), (count, total, low, high, size, buckets) in items:
+            result.setdefault(kind, {})[name] = {
+                'count': count,
+                'total_ms': total * 1000,
+                'mean_ms': total / count * 1000,
+                'min_ms': low * 1000,
+                'max_ms': high * 1000,
+                'bytes': size,
+                'p50_ms': self._percentile(buckets, count, 0.5),
+                'p90_ms': self._percentile(buckets, count, 0.9),
+                'p99_ms': self._percentile(buckets, count, 0.99),
+                'histogram': buckets,
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def dump(self, path=None):
+        """
+        :param path: file to write, None to only return the text
+        :return: stats as JSON text
+        """
+        text = json.dumps(self.stats(), ensure_ascii=False, indent=2, sort_keys=True)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+
+_table_id_re = re.compile(r'tableId=(\w+)')
+
+
+def endpoint_name(url):
+    """
+    :return: path of url, with the tableId for DataTable.jsp, e.g. '/taglib/DataTable.jsp?tableId=6093'
+    """
+    parts = urllib.parse.urlsplit(url)
+    m = _table_id_re.search(parts.query)
+    if m:
+        return parts.path + '?tableId=' + m.group(1)
+    return parts.path
+
+
+class InstrumentedSession(requests.Session):
+    """
+    requests.Session recording every request to a StatsRecorder
+    the time of a streamed request covers the response headers only
+
+    When a request ends up at the CAS login page the session has expired:
+    on_expired(started) is called with the time.monotonic() the request was
+    started at, and the request is sent once more if it returns True.
+    Pass relogin=False to a request to skip this.
+    """
+    _login_path = '/cas/login'
+    _idempotent_methods = frozenset(('GET', 'HEAD', 'OPTIONS'))
+    _retry_status = frozenset((502, 503, 504))
+
+    def __init__(self, recorder):
+        requests.Session.__init__(self)
+        self.recorder = recorder
+        self.on_expired = None
+        # default (connect, read) timeout of every request
+        self.timeout = None
+        # retries of idempotent requests after a connection error, timeout or 502-504
+        self.read_retries = 0
+        self.retry_backoff = 0.2
+
+    def _request(self, method, url, *args, **kwargs):
+        if not self.recorder.enabled:
+            return requests.Session.request(self, method, url, *args, **kwargs)
+        with self.recorder.phase('http', endpoint_name(url)) as phase:
+            r = requests.Session.request(self, method, url, *args, **kwargs)
+            if not kwargs.get('stream'):
+                phase.size = len(r.content)
+        return r
+
+    def _retry(self, retries, method, url, *args, **kwargs):
+        for attempt in range(retries + 1):
+            try:
+                r = self._request(method, url, *args, **kwargs)
+            except CassetteMiss:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+            else:
+                if attempt >= retries or r.status_code not in self._retry_status:
+                    return r
+                r.close()
+            time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def request(self, method, url, *args, **kwargs):
+        """
+        extra keyword arguments:
+        relogin: handle an expired session, default True
+        idempotent: the request only reads and may be retried, default True for GET / HEAD / OPTIONS
+        """
+        relogin = kwargs.pop('relogin', True) and self.on_expired is not None
+        idempotent = kwargs.pop('idempotent', None)
+        if idempotent is None:
+            idempotent = method.upper() in self._idempotent_methods
+        retries = self.read_retries if idempotent else 0
+        # only when not given, an explicit timeout=None waits forever
+        kwargs.setdefault('timeout', self.timeout)
+
+        started = time.monotonic()
+        r = self._retry(retries, method, url, *args, **kwargs)
+        if relogin and self.is_login_redirect(url, r) and self.on_expired(started):
+            r.close()
+            r = self._retry(retries, method, url, *args, **kwargs)
+        return r
+
+    def is_login_redirect(self, url, r):
+        """
+        :return: True if the request to url was sent to the CAS login page instead
+        """
+        if urllib.parse.urlsplit(url).path.endswith(self._login_path):
+            return False
+        if r.is_redirect:
+            target = r.headers.get('Location', '')
+        elif r.history:
+            target = r.url
+        else:
+            return False
+        return urllib.parse.urlsplit(target).path.endswith(self._login_path)
+
+
+class PreparedSelection:
+    """
+    encrypted selection / cancel request built once and submitted many times
+
+    params and their md5 are fixed at build time, the DES result is kept until
+    _deskey changes and the token until the timestamp (1s resolution) changes.
+    Rebuild it after the select info changes.
+    """
+    def __init__(self, url, params, name=''):
+        self.url = url
+        self.params = params
+        self.name = name
+        self.params_md5 = hashlib.md5(params.encode('ascii')).hexdigest()
+        self._deskey = None
+        self._encrypted = b''
+        self._timestamp = ''
+        self._token = ''
+
+    def encrypt(self, des, deskey):
+        """
+        :param des: DES engine
+        :param deskey: current _deskey
+        :return: encrypted params, token, timestamp
+        """
+        if deskey != self._deskey:
+            self._encrypted = base64.b64encode(des.str_enc(self.params, deskey).encode())
+            self._deskey = deskey
+
+        timestamp = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+        if timestamp != self._timestamp:
+            time_md5 = hashlib.md5(timestamp.encode('ascii')).hexdigest()
+            self._token = hashlib.md5((self.params_md5 + time_md5).encode('ascii')).hexdigest()
+            self._timestamp = timestamp
+        return self._encrypted, self._token, timestamp
+
+
 class BNUjwc:
     _grade_url = "http://zyfw.bnu.edu.cn/jw/common/getStuGradeSpeciatyInfo.action"
     _validate_code_url = 'http://zyfw.bnu.edu.cn/cas/genValidateCode?dateTime='
@@ -165,6 +1324,10 @@ class BNUjwc:
     _evaluate_form_url = 'http://zyfw.bnu.edu.cn/student/wspj_tjzbpj_wjdcb_pj.jsp?'
     _evaluate_save_url = 'http://zyfw.bnu.edu.cn/jw/wspjZbpjWjdc/save.action'
     _select_info_url = 'http://zyfw.bnu.edu.cn/jw/common/getWsxkTimeRange.action?xktype='
+    _clock_url = 'http://zyfw.bnu.edu.cn/'
+
+    _base_url = 'http://zyfw.bnu.edu.cn'
+    _cas_base_url = 'http://cas.bnu.edu.cn'
 
     _course_list_table_id = '5327018'
     _cancel_list_table_id = '6093'
@@ -175,37 +1338,202 @@ class BNUjwc:
 
     _exam_drop_name = 'Ms_KSSW_FBXNXQKSLC'
 
-    def __init__(self, username, password):
+    # question / text templates of the teacher evaluation form
+    _evaluate_zbmb_m = '005'
+    _evaluate_wjmb_m = '002'
+
+    # times shown by the server are Beijing time
+    _server_tz = timezone(timedelta(hours=8))
+    # (start, end) keys of the selection window in select info
+    _window_keys = (('kssj', 'jssj'), ('xkkssj', 'xkjssj'), ('ksrq', 'jsrq'))
+    _window_re = re.compile(r'(\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{2}(?::\d{2})?)\s*(?:→|->|~|至|到)\s*'
+                            r'(\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{2}(?::\d{2})?)')
+
+    _charset_re = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+
+    # messages meaning the server refused the encrypted params / token
+    _deskey_reject_markers = ('token', '令牌', '非法', '参数错误')
+
+    def __init__(self, username, password, des_engine='python', deskey_ttl=60, deskey_prefetch=0.8,
+                 select_info_ttl=300, table_parser='html', compact_rows=True, snapshot=None,
+                 catalog_max_age=600, base_url=None, cas_url=None, instrument=False, record=None, replay=None,
+                 auto_relogin=True, pool_size=10, timeout=(5, 30), submit_timeout=(3, 10), read_retries=2,
+                 fast_decode=True, encoding=None, read_workers=4, read_cache_ttl=0):
         """
         :param username: username (student id)
         :param password: password (default: birthday - yyyymmdd)
+        :param des_engine: 'python' (native, default) or 'execjs' (des.js through PyExecJS)
+        :param deskey_ttl: seconds a fetched _deskey is reused (0 to fetch it for every request)
+        :param deskey_prefetch: fraction of deskey_ttl after which the key is refreshed in background
+        :param select_info_ttl: seconds the select info of each xktype is reused (0 to always re-POST)
+        :param table_parser: 'html' (TableHTMLParser) or 'regex' (TableRegexParser) for DataTable.jsp pages
+        :param compact_rows: return table rows as Course records instead of dicts
+        :param snapshot: SnapshotStore or its path, to keep catalogs, student info and select info across runs
+        :param catalog_max_age: seconds after which a stored catalog is refreshed in background
+        :param base_url: root of the educational administration system, e.g. a local mockserver
+        :param cas_url: root of the CAS login, same as base_url by default when base_url is given
+        :param instrument: record per-endpoint latency and size and parse / encrypt time, see get_stats
+        :param record: cassette file to record every request and response to, written at exit or by save_cassette
+        :param replay: cassette file to answer every request from, without network
+        :param auto_relogin: login again and resend the request when the session has expired
+        :param pool_size: keep-alive connections kept per host
+        :param timeout: (connect, read) seconds for every request but selection / cancel, None to wait forever
+        :param submit_timeout: (connect, read) seconds for selection / cancel requests, which are never retried
+        :param read_retries: retries of requests which only read, after a connection error, timeout or 502-504
+        :param fast_decode: decode response bytes with the charset header or the site encoding learned once,
+                            instead of r.text which detects the encoding of every page lacking a charset
+        :param encoding: site encoding for fast_decode, learned from the first response if None
+        :param read_workers: threads of map_reads, evaluate_all and background refreshes
+        :param read_cache_ttl: seconds table lists and the selection result are reused, 0 to only share
+                               a request with threads asking for the same page while it is in flight
+
+        one client can be used from many threads: each thread sends through a session of its own
+        (see new_session) over one shared cookie jar, student and select info are read-only snapshots
         """
         self._username = username
         self._password = password
 
-        self._s = requests.Session()
-        self._s.headers.update({
+        if base_url:
+            self.set_base_url(base_url, cas_url)
+
+        self.stats = StatsRecorder(instrument)
+        self.timeout = timeout
+        self.read_retries = read_retries
+        self.submit_timeout = submit_timeout
+        self.pool_size = pool_size
+        self.fast_decode = fast_decode
+        self.encoding = encoding
+        self.auto_relogin = auto_relogin
+        self._login_lock = threading.Lock()
+        self._login_time = 0
+        self.relogin_count = 0
+        self._cassette = None
+        if record or replay:
+            self._cassette = Cassette(record or replay, 'record' if record else 'replay',
+                                      {'__username__': username, '__password__': password}, encoding)
+            if record:
+                atexit.register(self._cassette.save)
+
+        # every thread sends through a session of its own, all of them share this cookie jar
+        self._cookies = requests.cookies.RequestsCookieJar()
+        self._headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
-            'Referer': 'http://zyfw.bnu.edu.cn'
-        })
+            'Referer': self._base_url
+        }
+        self._adapter_kwargs = {}
+        self._sessions = weakref.WeakSet()
+        self._local = threading.local()
+        self._local.session = self.new_session()
 
         self._lt = ''
         self._execution = ''
-        self._info = {}
-        self._select_info = {}
+        # student and select info are read-only snapshots, replaced as a whole
+        self._info = freeze({})
+        self._select_info = freeze({})
+        self._select_info_cache = {}
+        self._flights = SingleFlight(read_cache_ttl)
+        self._read_executor = None
+        self._executor_lock = threading.Lock()
+        self.read_workers = read_workers
+        self.select_info_ttl = select_info_ttl
         self._grade_info = {}
-        self._table_parser = TableHTMLParser()
-        self._result_parser = ResultHTMLParser()
-        self._evaluate_parser = EvaluateHTMLParser()
+        self._catalog = None
+        self._catalog_thread = None
+        self.catalog_max_age = catalog_max_age
+        if isinstance(snapshot, str):
+            snapshot = SnapshotStore(snapshot)
+        self._snapshot = snapshot
+        # parsers keep state while feeding, every thread gets its own ones
+        self.set_table_parser(table_parser)
+        self.compact_rows = compact_rows
+
+        self._des = get_des_engine(des_engine)
+
+        self.deskey_ttl = deskey_ttl
+        self.deskey_prefetch = deskey_prefetch
+        self._deskey = ''
+        self._deskey_time = 0
+        self._deskey_lock = threading.Lock()
+        self._deskey_refreshing = False
+        self._deskey_stats = {'hit': 0, 'miss': 0, 'prefetch': 0, 'invalidate': 0}
+
+    def set_base_url(self, base_url, cas_url=None):
+        """
+        point every url of this instance to another server
+        :param base_url: e.g. 'http://127.0.0.1:8080'
+        :param cas_url: root of the CAS login, base_url if None
+        """
+        base_url = base_url.rstrip('/')
+        cas_url = (cas_url or base_url).rstrip('/')
+        for name in dir(BNUjwc):
+            url = getattr(BNUjwc, name)
+            if name.endswith('_url') and isinstance(url, str) and name not in ('_base_url', '_cas_base_url'):
+                url = url.replace(BNUjwc._base_url, base_url).replace(BNUjwc._cas_base_url, cas_url)
+                setattr(self, name, url)
+        self._base_url = base_url
+        self._cas_base_url = cas_url
+
+    def _charset(self, r):
+        """
+        :return: charset of the Content-Type header, None if there is none
+        """
+        m = BNUjwc._charset_re.search(r.headers.get('Content-Type', ''))
+        return m.group(1) if m else None
 
-        # des js
-        with open('des.js', 'r', encoding='utf8') as f:
-            self._des = execjs.compile(f.read())
+    def _learn_encoding(self, content, final=True):
+        """
+        find the site encoding once, pages served later without charset reuse it
+        :param content: response body, or its first chunks when final is False
+        :return: encoding, None if content is ASCII
+        """
+        if content.isascii():
+            # nothing to learn from, every candidate decodes it the same
+            return None
+        try:
+            # a chunk may end inside a character, only invalid bytes rule utf-8 out
+            codecs.getincrementaldecoder('utf-8')().decode(content, final)
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            encoding = codecs.lookup(requests.compat.chardet.detect(content)['encoding'] or 'utf-8').name
+            if encoding in ('gb2312', 'gbk'):
+                # the guess only covers the characters seen so far, later pages may have names outside it
+                encoding = 'gb18030'
+        self.encoding = encoding
+        return encoding
+
+    def _text(self, r):
+        """
+        :return: response body as text, see fast_decode
+        """
+        if not self.fast_decode:
+            return r.text
+        encoding = self._charset(r) or self.encoding or self._learn_encoding(r.content) or 'utf-8'
+        return r.content.decode(encoding, 'replace')
+
+    def _parser(self, name):
+        """
+        :param name: 'table', 'result' or 'evaluate'
+        :return: context manager lending a reset parser, see ParserPool
+        """
+        return self._parsers[name].acquire()
+
+    def set_table_parser(self, name):
+        """
+        :param name: 'html' or 'regex'
+        """
+        if name not in TABLE_PARSERS:
+            raise ValueError('unknown table parser: ' + str(name))
+        self._table_parser_cls = TABLE_PARSERS[name]
+        self._parsers = {
+            'table': ParserPool(self._table_parser_cls),
+            'result': ParserPool(ResultHTMLParser),
+            'evaluate': ParserPool(EvaluateHTMLParser),
+        }
 
     def _get_grade_info(self):
-        url = BNUjwc._grade_url
-        r = self._s.post(url, data={'xh': self._info['xh']})
-        j = json.loads(r.text)
+        url = self._grade_url
+        r = self._s.post(url, data={'xh': self._info['xh']}, idempotent=True)
+        j = json.loads(self._text(r))
         self._grade_info = json.loads(j['result'])
         return self._grade_info
 
@@ -220,12 +1548,12 @@ class BNUjwc:
         lt = ''
         execution = ''
 
-        r = self._s.get(BNUjwc._login_url)
+        r = self._s.get(self._login_url, relogin=False)
 
         if r.status_code != 200:
             raise LoginError('获取登录参数失败')
 
-        html = r.text
+        html = self._text(r)
 
         m = re.search(r'input type="hidden" name="lt" value="(.*)"', html)
         if m:
@@ -241,7 +1569,7 @@ class BNUjwc:
     def _get_validate_code(self):
         """
         """
-        r = self._s.get(BNUjwc._validate_code_url + str(random.randint(0, 1000000)), stream=True)
+        r = self._s.get(self._validate_code_url + str(random.randint(0, 1000000)), stream=True, relogin=False)
         with open('code.jpg', 'wb') as f:
             for chunk in r.iter_content(1024):
                 f.write(chunk)
@@ -262,42 +1590,363 @@ class BNUjwc:
         }
         """
         if self._info:
-            return
+            return self._info
+
+        if self._snapshot:
+            stored = self._snapshot.get('student_info', self._username)
+            if stored:
+                self._info = freeze(stored[1])
+                return self._info
 
-        r = self._s.post(BNUjwc._student_info_url)
-        info_node = etree.fromstring(r.text)
+        r = self._s.post(self._student_info_url, idempotent=True)
+        with self.stats.phase('parse', 'student_info'):
+            # the XML declaration names the encoding
+            info_node = etree.fromstring(r.content if self.fast_decode else r.text)
 
+        # built aside and published at once, other threads never see it half filled
+        info = {}
         try:
-            self._info[info_node[0].tag] = info_node[0].text
+            info[info_node[0].tag] = info_node[0].text
             for e in info_node[1]:
-                self._info[e.tag] = e.text
+                info[e.tag] = e.text
         except Exception:
+            self._info = freeze(info)
             self._get_grade_info()
-            self._info['zydm'] = self._grade_info['zydm']
+            info['zydm'] = self._grade_info['zydm']
             print("2016 incomplete info")
+        self._info = freeze(info)
 
+        if self._snapshot:
+            self._snapshot.put('student_info', self._username, self._info)
         return self._info
 
-    def _get_select_info(self, xktype=2):
-        url = BNUjwc._select_info_url + str(xktype)
-        r = self._s.post(url)
-        j = json.loads(r.text)
-        self._select_info = json.loads(j['result'])
-        return self._select_info
+    def _get_select_info(self, xktype=2, refresh=False):
+        """
+        get select info (time range, xn, xqM, ...) of xktype, cached for select_info_ttl seconds
+        :param xktype: 2 (select) or 5 (cancel)
+        :param refresh: ignore the cache
+        :return: select info dict
+        """
+        key = str(xktype)
+        cached = self._select_info_cache.get(key)
+        if not refresh and cached and time.time() - cached[0] < self.select_info_ttl:
+            # _select_info is only the last one seen, another thread may replace it at any time
+            self._select_info = cached[1]
+            return cached[1]
+
+        if self._snapshot and not refresh:
+            stored = self._snapshot.get('select_info', self._username + '|' + key)
+            if stored and time.time() - stored[0] < self.select_info_ttl:
+                info = freeze(stored[1])
+                self._select_info_cache[key] = (stored[0], info)
+                self._select_info = info
+                return info
+
+        def fetch():
+            r = self._s.post(self._select_info_url + key, idempotent=True)
+            j = json.loads(self._text(r))
+            info = freeze(json.loads(j['result']))
+            self._select_info_cache[key] = (time.time(), info)
+            if self._snapshot:
+                self._snapshot.put('select_info', self._username + '|' + key, info)
+            return info
+
+        info = self._flights.do(('select_info', key), fetch, cache=not refresh)
+        self._select_info = info
+        return info
+
+    def invalidate_select_info(self, xktype=None):
+        """
+        drop cached select info
+        :param xktype: xktype to drop, all if None
+        """
+        if xktype is None:
+            self._select_info_cache.clear()
+            self._flights.forget(lambda k: k[0] == 'select_info')
+        else:
+            self._select_info_cache.pop(str(xktype), None)
+            self._flights.forget(lambda k: k == ('select_info', str(xktype)))
 
-    def _get_table_list(self, table_id, post_data, get_data = ''):
+    def _get_table_list(self, table_id, post_data, get_data = '', stream=False):
         """
         get table page and parse the table HTML to a list of dict
         :param table_id: ID of table to get
         :param post_data: POST data
+        :param stream: parse the response while downloading and return a generator of rows
         :return: a list of dict (each dict is a row)
         """
+        if stream:
+            return self._iter_table_list(table_id, post_data, get_data)
+
+        def fetch():
+            if get_data:
+                r = self._s.post(self._table_url + table_id + '&' + get_data, data=post_data, idempotent=True)
+            else:
+                r = self._s.post(self._table_url + table_id, data=post_data, idempotent=True)
+            with self._parser('table') as parser, self.stats.phase('parse', 'table'):
+                parser.feed(self._text(r))
+                rows = parser.courses
+            return self._make_rows(rows)
+
+        # threads asking for the same page at once share one request, each gets its own list
+        key = ('table', table_id, get_data, tuple(sorted((k, str(v)) for k, v in post_data.items())))
+        return list(self._flights.do(key, fetch))
+
+    def _make_rows(self, rows):
+        if self.compact_rows:
+            with self.stats.phase('parse', 'rows'):
+                return [Course.from_dict(x) for x in rows]
+        return rows
+
+    def _iter_table_list(self, table_id, post_data, get_data = '', chunk_size=8192):
+        """
+        feed table page chunks to the parser as they arrive and yield each row once it is complete
+        stop iterating to close the connection early
+        """
+        url = self._table_url + table_id
         if get_data:
-            r = self._s.post(BNUjwc._table_url + table_id + '&' + get_data, data=post_data)
+            url += '&' + get_data
+        r = self._s.post(url, data=post_data, stream=True, idempotent=True)
+        encoding = (self._charset(r) or self.encoding) if self.fast_decode else r.encoding
+        # the parser stays out of the pool until the generator is exhausted or closed
+        with self._parser('table') as parser:
+            parser.begin()
+            yield from self._iter_chunks(r, parser, encoding, chunk_size)
+
+    def _iter_chunks(self, r, parser, encoding, chunk_size, sample=4096):
+        """
+        :param encoding: None to learn it like _text, from the first sample bytes which are not all ASCII
+        """
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace') if encoding else None
+        pending = b''
+        try:
+            for chunk in r.iter_content(chunk_size):
+                if decoder is None:
+                    if not pending and chunk.isascii():
+                        text = chunk.decode('ascii')
+                    else:
+                        # a few bytes are not enough to tell GBK from other encodings
+                        pending += chunk
+                        if len(pending) < sample:
+                            continue
+                        decoder = codecs.getincrementaldecoder(self._learn_encoding(pending, False))(errors='replace')
+                        chunk, pending = pending, b''
+                        text = decoder.decode(chunk)
+                else:
+                    text = decoder.decode(chunk)
+                with self.stats.phase('parse', 'table_chunk') as phase:
+                    phase.size = len(chunk)
+                    parser.feed_chunk(text)
+                yield from self._make_rows(parser.pop_courses())
+            if pending:
+                parser.feed_chunk(pending.decode(self._learn_encoding(pending) or 'utf-8', 'replace'))
+            elif decoder:
+                parser.feed_chunk(decoder.decode(b'', final=True))
+            parser.close()
+            yield from self._make_rows(parser.pop_courses())
+        finally:
+            r.close()
+
+    def _fetch_deskey(self):
+        """
+        fetch a fresh _deskey from the server
+        :return: _deskey
+        """
+        r = self._s.get(self._deskey_url + str(random.randint(100000, 100000000)))
+
+        _deskey = ''
+        m = re.search(r"var _deskey = '(.*)';", self._text(r))
+        if m:
+             _deskey = m.group(1)
+        return _deskey
+
+    def _refresh_deskey(self):
+        try:
+            _deskey = self._fetch_deskey()
+            if _deskey:
+                with self._deskey_lock:
+                    self._deskey = _deskey
+                    self._deskey_time = time.time()
+        finally:
+            self._deskey_refreshing = False
+
+    def _get_deskey(self):
+        """
+        get _deskey from cache, fetch it if expired and prefetch it in background when about to expire
+        :return: _deskey
+        """
+        with self._deskey_lock:
+            age = time.time() - self._deskey_time
+            if self._deskey and age < self.deskey_ttl:
+                self._deskey_stats['hit'] += 1
+                if age >= self.deskey_ttl * self.deskey_prefetch and not self._deskey_refreshing:
+                    self._deskey_refreshing = True
+                    self._deskey_stats['prefetch'] += 1
+                    # on a worker which keeps its session, a thread of its own would open another pool
+                    self._executor().submit(self._refresh_deskey)
+                return self._deskey
+            self._deskey_stats['miss'] += 1
+
+        _deskey = self._fetch_deskey()
+        with self._deskey_lock:
+            self._deskey = _deskey
+            self._deskey_time = time.time()
+        return _deskey
+
+    def invalidate_deskey(self):
+        """
+        drop cached _deskey, the next encrypted request fetches a new one
+        """
+        with self._deskey_lock:
+            self._deskey = ''
+            self._deskey_time = 0
+            self._deskey_stats['invalidate'] += 1
+
+    def get_deskey_stats(self):
+        """
+        :return: {'hit': 0, 'miss': 0, 'prefetch': 0, 'invalidate': 0}
+        """
+        return dict(self._deskey_stats)
+
+    def get_read_stats(self):
+        """
+        :return: {'call': 0, 'shared': 0, 'cached': 0}, reads sent, joined while in flight and reused
+        """
+        return self._flights.stats()
+
+    @property
+    def _s(self):
+        """
+        session of the calling thread, created by new_session on first use
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.new_session()
+        return session
+
+    def new_session(self):
+        """
+        a session for one worker thread: its own connection pool, the shared cookie jar
+        (so a login or re-login in any thread counts for all), the client's headers,
+        timeouts, retries and record / replay
+        :return: InstrumentedSession
+        """
+        session = InstrumentedSession(self.stats)
+        session.cookies = self._cookies
+        session.headers.update(self._headers)
+        session.on_expired = self._on_session_expired
+        session.timeout = self.timeout
+        session.read_retries = self.read_retries
+        self._mount(session, dict(self._adapter_kwargs))
+        self._sessions.add(session)
+        return session
+
+    def _mount(self, session, kwargs):
+        kwargs.setdefault('pool_maxsize', self.pool_size)
+        if self._cassette:
+            adapter = CassetteAdapter(self._cassette, **kwargs)
         else:
-            r = self._s.post(BNUjwc._table_url + table_id, data=post_data)
-        self._table_parser.feed(r.text)
-        return self._table_parser.courses
+            adapter = HTTPAdapter(**kwargs)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return adapter
+
+    def mount_adapter(self, **kwargs):
+        """
+        mount new transport adapters for http and https on every session, keeping record / replay
+        :param kwargs: HTTPAdapter arguments, pool_maxsize is pool_size by default
+        """
+        self._adapter_kwargs = kwargs
+        for session in list(self._sessions):
+            self._mount(session, dict(kwargs))
+
+    def _release_session(self):
+        """
+        close the session of the calling thread, for threads about to end
+        """
+        session = self._local.__dict__.pop('session', None)
+        if session is not None:
+            self._sessions.discard(session)
+            session.close()
+
+    def _executor(self):
+        """
+        :return: the shared pool of read_workers threads, each keeping its session
+        """
+        with self._executor_lock:
+            if self._read_executor is None:
+                self._read_executor = ThreadPoolExecutor(self.read_workers, thread_name_prefix='bnujwc-read')
+            return self._read_executor
+
+    @contextlib.contextmanager
+    def _workers(self, workers=None):
+        """
+        executor for concurrent requests: the shared one, or a pool of its own when workers
+        differs from read_workers, whose sessions are closed with it
+        """
+        if not workers or workers == self.read_workers:
+            yield self._executor()
+            return
+        sessions = []
+        # the shared executor may be in use by another call, never resize it
+        with ThreadPoolExecutor(workers, thread_name_prefix='bnujwc-read',
+                                initializer=lambda: sessions.append(self._s)) as executor:
+            try:
+                yield executor
+            finally:
+                executor.shutdown()
+                for session in sessions:
+                    self._sessions.discard(session)
+                    session.close()
+
+    def close(self):
+        """
+        close the connections of every session and stop the read workers
+        """
+        with self._executor_lock:
+            executor, self._read_executor = self._read_executor, None
+        if executor:
+            executor.shutdown(wait=False)
+        for session in list(self._sessions):
+            session.close()
+
+    def save_cassette(self, path=None):
+        """
+        write the recorded cassette
+        :param path: another file than the one given to record
+        """
+        if self._cassette:
+            self._cassette.save(path)
+
+    def get_stats(self):
+        """
+        per-endpoint and per-phase stats, empty unless instrument is on
+        :return: {'http': {'/taglib/DataTable.jsp?tableId=6093': {...}, ...}, 'parse': {...}, 'encrypt': {...}},
+                 see StatsRecorder.stats
+        """
+        return self.stats.stats()
+
+    def reset_stats(self):
+        self.stats.reset()
+
+    def dump_stats(self, path=None):
+        """
+        :param path: file to write the stats to as JSON
+        :return: JSON text
+        """
+        return self.stats.dump(path)
+
+    def add_trace_hook(self, hook):
+        """
+        call hook(event, kind, name, seconds) when a request, parse or encrypt phase starts and ends
+        turns instrumentation on
+        :param hook: e.g. lambda event, kind, name, seconds: profiler.mark(event, kind + ':' + name)
+        """
+        self.stats.enabled = True
+        self.stats.hooks.append(hook)
+
+    def remove_trace_hook(self, hook):
+        self.stats.hooks.remove(hook)
 
     def _encrypt_params(self, params):
         """
@@ -305,33 +1954,68 @@ class BNUjwc:
         :param params: params to be encrypted
         :return: encrypted params
         """
-        r = self._s.get(BNUjwc._deskey_url + str(random.randint(100000, 100000000)))
-
-        _deskey = ''
-        m = re.search(r"var _deskey = '(.*)';", r.text)
-        if m:
-             _deskey = m.group(1)
+        _deskey = self._get_deskey()
+
+        with self.stats.phase('encrypt', 'params'):
+            timestamp = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+            # timestamp = '2016-06-14 20:30:00'
+            m = hashlib.md5()
+            m.update(params.encode('ascii'))
+            params_md5 = m.hexdigest()
+            m = hashlib.md5()
+            m.update(timestamp.encode('ascii'))
+            time_md5 = m.hexdigest()
+            m = hashlib.md5()
+            m.update((params_md5+time_md5).encode('ascii'))
+            token = m.hexdigest()
+            _params = base64.b64encode(self._des.str_enc(params, _deskey).encode())
+            return _params, token, timestamp
+
+    def _is_deskey_rejected(self, ret):
+        if ret.get('status') == '200':
+            return False
+        message = str(ret.get('message', ''))
+        return any(x in message for x in BNUjwc._deskey_reject_markers)
+
+    def _post_encrypted(self, url, params):
+        """
+        encrypt params and POST them
+        :param url: url to POST
+        :param params: params to be encrypted
+        :return: json result
+        """
+        return self.submit_prepared(PreparedSelection(url, params))
 
-        timestamp = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
-        # timestamp = '2016-06-14 20:30:00'
-        m = hashlib.md5()
-        m.update(params.encode('ascii'))
-        params_md5 = m.hexdigest()
-        m = hashlib.md5()
-        m.update(timestamp.encode('ascii'))
-        time_md5 = m.hexdigest()
-        m = hashlib.md5()
-        m.update((params_md5+time_md5).encode('ascii'))
-        token = m.hexdigest()
-        _params = base64.b64encode(self._des.call('strEnc', params, _deskey).encode())
-        return _params, token, timestamp
+    def submit_prepared(self, prepared):
+        """
+        POST a prepared request, retry once with a fresh _deskey if the server rejects the token
+        :param prepared: PreparedSelection
+        :return: json result
+        """
+        for retry in (False, True):
+            _deskey = self._get_deskey()
+            with self.stats.phase('encrypt', 'prepared'):
+                _params, token, timestamp = prepared.encrypt(self._des, _deskey)
+            try:
+                r = self._s.post(prepared.url, data={
+                    'params': _params,
+                    'token': token,
+                    'timestamp': timestamp
+                }, timeout=self.submit_timeout)
+            finally:
+                # lists and results read before a selection or cancel are stale once it was sent
+                self._flights.forget(lambda k: k[0] != 'select_info')
+            ret = json.loads(self._text(r))
+            if retry or not self._is_deskey_rejected(ret):
+                return ret
+            self.invalidate_deskey()
 
     def _get_droplist(self, name):
         post_data = {
             'comboBoxName': name,
         }
-        r = self._s.post(BNUjwc._droplist_url, post_data)
-        return r.text
+        r = self._s.post(self._droplist_url, post_data, idempotent=True)
+        return self._text(r)
 
     def _login_old(self, code):
         """
@@ -357,12 +2041,12 @@ class BNUjwc:
         }
 
         try:
-            r = self._s.post(BNUjwc._login_old_url, data=post_data)
+            r = self._s.post(self._login_old_url, data=post_data, relogin=False)
         except ConnectionError as e:
             raise LoginError('连接失败：' + e.strerror)
         if r.status_code != 200:
             raise LoginError('登录提交失败！状态码：' + str(r.status_code))
-        return json.loads(r.text)
+        return json.loads(self._text(r))
 
     @staticmethod
     def _default_code_callback(code_img):
@@ -370,16 +2054,115 @@ class BNUjwc:
         return input()
 
     def get_cookies(self):
-        return self._s.cookies
+        return self._cookies
 
     def set_cookies(self, cookies):
-        self._s.cookies = cookies
+        """
+        :param cookies: CookieJar to copy into the jar every session shares
+        """
+        self._cookies.clear()
+        for cookie in cookies:
+            self._cookies.set_cookie(cookie)
+
+    def _session_key(self):
+        return self._username + '@' + self._base_url
+
+    def save_session(self):
+        """
+        keep the cookies in the snapshot store, restore_session picks them up next start
+        """
+        if not self._snapshot:
+            return
+        cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+                    'expires': c.expires, 'secure': c.secure} for c in self._cookies]
+        self._snapshot.put('session', self._session_key(), cookies)
+
+    def restore_session(self):
+        """
+        load the cookies kept by save_session and check them with one small request
+        :return: True if the saved session is still logged in
+        """
+        if not self._snapshot:
+            return False
+        stored = self._snapshot.get('session', self._session_key())
+        if not stored:
+            return False
+        for c in stored[1]:
+            self._cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'],
+                                expires=c['expires'], secure=c['secure'])
+        if self.check_session():
+            self._login_time = time.monotonic()
+            return True
+        self._cookies.clear()
+        return False
+
+    def check_session(self):
+        """
+        cheap check of the current session: fetch _deskey without following the redirect to CAS
+        the fetched _deskey is cached
+        :return: True if logged in
+        """
+        r = self._s.get(self._deskey_url + str(random.randint(100000, 100000000)),
+                        allow_redirects=False, relogin=False)
+        m = re.search(r"var _deskey = '(.*)';", self._text(r)) if r.status_code == 200 else None
+        if not m:
+            return False
+        with self._deskey_lock:
+            self._deskey = m.group(1)
+            self._deskey_time = time.time()
+        return True
+
+    def _on_session_expired(self, started):
+        """
+        login again unless another thread did so after started
+        :return: True to resend the request
+        """
+        if not self.auto_relogin:
+            return False
+        with self._login_lock:
+            if self._login_time <= started:
+                self._cookies.clear()
+                self.invalidate_deskey()
+                self.login()
+                self.relogin_count += 1
+        return True
+
+    def ensure_login(self, code_callback=None, retries=None, backoff=1.0, max_backoff=60.0):
+        """
+        reuse the saved session or login, retrying with exponential backoff
+        :param retries: attempts after the first one, None for no limit
+        :param backoff: seconds before the first retry, doubled (with jitter) up to max_backoff
+        :return: True if the saved session was reused
+        """
+        if self.restore_session():
+            return True
+        attempt = 0
+        while True:
+            try:
+                self.login(code_callback)
+                return False
+            except PasswordError:
+                raise
+            except (LoginError, requests.exceptions.RequestException):
+                if retries is not None and attempt >= retries:
+                    raise
+            attempt += 1
+            time.sleep(min(backoff * 2 ** (attempt - 1), max_backoff) * random.uniform(0.5, 1.0))
 
     def login(self, code_callback = None):
         """
-        login
+        login, the session is saved to the snapshot store if there is one
         :return: None
         """
+        try:
+            self._login(code_callback)
+        finally:
+            # lt and execution are good for one attempt only
+            self._lt = self._execution = ''
+        self._login_time = time.monotonic()
+        self.save_session()
+
+    def _login(self, code_callback):
         self._get_login_params()
 
         post_data = {
@@ -392,15 +2175,17 @@ class BNUjwc:
         }
 
         try:
-            r = self._s.post(BNUjwc._login_url, data=post_data)
+            # nothing sent while logging in may re-login, _on_session_expired holds the login lock
+            r = self._s.post(self._login_url, data=post_data, relogin=False)
         except ConnectionError as e:
             raise LoginError('连接失败：' + e.strerror)
-        if r.text.find('用户名密码输入有误。') != -1:
-            raise LoginError('用户密码错误')
+        text = self._text(r)
+        if text.find('用户名密码输入有误。') != -1:
+            raise PasswordError('用户密码错误')
         if r.status_code != 200:
             raise LoginError('登录提交失败！状态码：' + str(r.status_code))
-        if r.text.find('北京师范大学教务网络管理系统') != -1:
-            code_img = jwc._get_validate_code()
+        if text.find('北京师范大学教务网络管理系统') != -1:
+            code_img = self._get_validate_code()
             code = ''
             if code_callback:
                 code = code_callback(code_img)
@@ -408,13 +2193,78 @@ class BNUjwc:
                 code = BNUjwc._default_code_callback(code_img)
             self._login_old(code)
 
-    def ready_for_threading(self):
+    def ready_for_threading(self, warm_select_info=False, connections=0):
+        """
+        fetch shared info before time critical work
+        :param warm_select_info: also cache select info of xktype 2 and 5
+        :param connections: keep-alive connections to open, see warm_connections
+        """
+        self._get_student_info()
+        self._get_deskey()
+        if warm_select_info:
+            self._get_select_info(5)
+            self._get_select_info(2)
+        if connections:
+            self.warm_connections(connections)
+
+    def warm_connections(self, count=None):
+        """
+        open keep-alive connections to the server at once, so requests of a following burst skip TCP setup
+        the server drops idle connections after a while, call it shortly before the burst
+        :param count: connections to open, pool_size by default
+        :return: number of connections which answered
+        """
+        count = min(count or self.pool_size, self.pool_size)
+        ok = []
+        # the pool of the calling thread's session is the one to fill
+        session = self._s
+
+        def head():
+            try:
+                session.head(self._clock_url, allow_redirects=False, relogin=False).close()
+                ok.append(True)
+            except requests.exceptions.RequestException:
+                pass
+
+        # concurrent requests can not share a connection, so each one opens its own
+        threads = [threading.Thread(target=head, daemon=True) for _ in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return len(ok)
+
+    _read_methods = frozenset([
+        'get_plan_courses', 'get_elective_courses', 'get_cancel_courses', 'get_catalog',
+        'view_plan_course', 'get_selection_result', 'get_selection_window', 'get_exam_rounds',
+        'get_exam_arragement', 'get_exam_scores', 'get_evaluate_list', 'get_evaluate_course_list',
+    ])
+
+    def map_reads(self, calls, workers=None):
+        """
+        run read requests concurrently, each worker thread sending through its own session
+        a re-login triggered by one of them is shared by the others through the cookie jar
+        :param calls: method names or (name, *args) tuples, e.g. ['get_selection_result', ('get_exam_scores', 2017, 1)]
+        :param workers: threads to use, read_workers by default
+        :return: results in the order of calls, the first exception is raised
+        """
+        funcs = []
+        for call in calls:
+            name, args = (call, ()) if isinstance(call, str) else (call[0], tuple(call[1:]))
+            if name not in self._read_methods:
+                raise ValueError('not a read method: %s' % name)
+            funcs.append(functools.partial(getattr(self, name), *args))
+        # student info is needed by most reads, fetch it once instead of in every worker
         self._get_student_info()
+        with self._workers(workers) as executor:
+            futures = [executor.submit(f) for f in funcs]
+            return [f.result() for f in futures]
 
-    def get_plan_courses(self, show_full=False):
+    def get_plan_courses(self, show_full=False, stream=False):
         """
         get planned courses
         :param show_full: do show the courses at full
+        :param stream: return a generator yielding courses while the page is downloading
         :return: a list of dict [{
             'kcxz': '01', # unknown
             'xkfs': '学生网上选', # selection method
@@ -437,19 +2287,19 @@ class BNUjwc:
         }, ...]
         """
         self._get_student_info()
-        self._get_select_info()
+        select_info = self._get_select_info()
         post_data = {
             'initQry': 0,
-            'xktype': self._select_info['xktype'],
-            'xh': self._select_info['xh'],
-            'xn': self._select_info['xn'],
-            'xq': self._select_info['xqM'],
-            'nj': self._select_info['nj'],
+            'xktype': select_info['xktype'],
+            'xh': select_info['xh'],
+            'xn': select_info['xn'],
+            'xq': select_info['xqM'],
+            'nj': select_info['nj'],
             'zydm': self._info['zydm'],
             'items': '',
             'is_xjls': 'undefined',
             'kcfw': 'zxbnj',
-            'njzy': self._select_info['nj'] + '|' + self._info['zydm'],
+            'njzy': select_info['nj'] + '|' + self._info['zydm'],
             'lbgl': '',
             'kcmc': '',
             'kkdw_range': 'all',
@@ -460,7 +2310,7 @@ class BNUjwc:
         }
         if not show_full:
             post_data['xwxmkc'] = 'on'
-        return self._get_table_list(BNUjwc._course_list_table_id, post_data)
+        return self._get_table_list(BNUjwc._course_list_table_id, post_data, stream=stream)
 
     def get_cancel_courses(self):
         """
@@ -487,13 +2337,13 @@ class BNUjwc:
         }, ...]
         """
         self._get_student_info()
-        self._get_select_info(5)
+        select_info = self._get_select_info(5)
         post_data = {
             'xktype': 5,
-            'xh': self._select_info['xh'],
-            'xn': self._select_info['xn'],
-            'xq': self._select_info['xqM'],
-            'nj': self._select_info['nj'],
+            'xh': select_info['xh'],
+            'xn': select_info['xn'],
+            'xq': select_info['xqM'],
+            'nj': select_info['nj'],
             'zydm': self._info['zydm'],
             'items': '',
             'kcfw': 'All',
@@ -502,10 +2352,11 @@ class BNUjwc:
         }
         return self._get_table_list(BNUjwc._cancel_list_table_id, post_data)
 
-    def get_elective_courses(self, show_full=False):
+    def get_elective_courses(self, show_full=False, stream=False):
         """
         get elective courses
         :param show_full: do show the courses at full
+        :param stream: return a generator yielding courses while the page is downloading
         :return: a list of dict [{
             'xkfs': '学生网上选', # selection method
             'sksj': '1-16周 四[9-10]', # when
@@ -533,14 +2384,14 @@ class BNUjwc:
         }, ...]
         """
         self._get_student_info()
-        self._get_select_info()
+        select_info = self._get_select_info()
         post_data = {
             'initQry': 0,
-            'xktype': self._select_info['xktype'],
-            'xh': self._select_info['xh'],
-            'xn': self._select_info['xn'],
-            'xq': self._select_info['xqM'],
-            'nj': self._select_info['nj'],
+            'xktype': select_info['xktype'],
+            'xh': select_info['xh'],
+            'xn': select_info['xn'],
+            'xq': select_info['xqM'],
+            'nj': select_info['nj'],
             'zydm': self._info['zydm'],
             'kcdm': '',
             'kclb1': '',
@@ -550,7 +2401,7 @@ class BNUjwc:
             'skbzdm': '',
             'xf': '',
             'kcfw': 'zxggrx',
-            'njzy': self._select_info['nj'] + '|' + self._info['zydm'],
+            'njzy': select_info['nj'] + '|' + self._info['zydm'],
             'items': '',
             'is_xjls': 'undefined',
             'kcmc': '',
@@ -558,7 +2409,96 @@ class BNUjwc:
         }
         if not show_full:
             post_data['xwxmkc'] = 'on'
-        return self._get_table_list(BNUjwc._elective_course_list_table_id, post_data)
+        return self._get_table_list(BNUjwc._elective_course_list_table_id, post_data, stream=stream)
+
+    def prepare_cancel_course(self, course):
+        """
+        build the cancel request of specific course once
+        :param course: course info dict returned by get_cancel_courses
+        :return: PreparedSelection for submit_prepared
+        """
+        self._get_student_info()
+        select_info = self._get_select_info()
+        params = "xn=%s&xq=%s&xh=%s&kcdm=%s&skbjdm=%s&xktype=5" % (select_info['xn'], select_info['xqM'],
+                                                                   select_info['xh'], course['kcdm'], course['skbjdm'])
+        return PreparedSelection(self._cancel_course_url, params, course.get('kc', ''))
+
+    def _catalog_key(self):
+        select_info = self._get_select_info()
+        return '|'.join([self._username, select_info['xn'], select_info['xqM'], str(select_info['xktype'])])
+
+    def _download_catalog(self):
+        catalog = CourseCatalog(self.get_plan_courses(True), 'plan')
+        catalog.extend(self.get_elective_courses(True), 'elective')
+        if self._snapshot:
+            self._snapshot.put('catalog', self._catalog_key(), [[source, course] for course, source in
+                                                                zip(catalog.courses, catalog.sources)])
+        self._catalog = catalog
+        return catalog
+
+    def refresh_catalog_async(self):
+        """
+        download the catalog again in background, get_catalog keeps returning the old one until done
+        :return: refreshing thread
+        """
+        thread = self._catalog_thread
+        if thread is None or not thread.is_alive():
+            def download():
+                try:
+                    self._download_catalog()
+                finally:
+                    self._release_session()
+
+            thread = threading.Thread(target=download, daemon=True)
+            self._catalog_thread = thread
+            thread.start()
+        return thread
+
+    def get_catalog(self, refresh=False):
+        """
+        get full plan and elective course lists as a CourseCatalog, downloaded once
+        with a snapshot store, a stored catalog is returned at once and refreshed
+        in background when older than catalog_max_age
+        :param refresh: download the lists again
+        :return: CourseCatalog, sources are 'plan' and 'elective'
+        """
+        if refresh:
+            return self._download_catalog()
+        if self._catalog is not None:
+            return self._catalog
+
+        if self._snapshot:
+            stored = self._snapshot.get('catalog', self._catalog_key())
+            if stored:
+                updated, rows = stored
+                catalog = CourseCatalog()
+                for source, course in rows:
+                    catalog.add(Course.from_dict(course) if self.compact_rows else course, source)
+                self._catalog = catalog
+                if time.time() - updated >= self.catalog_max_age:
+                    self.refresh_catalog_async()
+                return catalog
+        return self._download_catalog()
+
+    def find_plan_course(self, kcdm):
+        """
+        find planned course by code, stop downloading the list once found
+        :param kcdm: code for course
+        :return: course info dict as get_plan_courses, None if not found
+        """
+        return next((x for x in self.get_plan_courses(True, stream=True) if x.get('kcdm') == kcdm), None)
+
+    def find_elective_course(self, kcdm, skbjdm=''):
+        """
+        find elective course by code, stop downloading the list once found
+        :param kcdm: code for course
+        :param skbjdm: code for class of the course, any class if empty
+        :return: course info dict as get_elective_courses, None if not found
+        """
+        for x in self.get_elective_courses(True, stream=True):
+            if x.get('kcdm') == kcdm and (not skbjdm or x.get('skbjdm') == skbjdm):
+                return x
+        return None
 
     def cancel_course(self, course):
         """
@@ -570,17 +2510,7 @@ class BNUjwc:
             'message': ''
         }
         """
-        self._get_student_info()
-        self._get_select_info()
-        params = "xn=%s&xq=%s&xh=%s&kcdm=%s&skbjdm=%s&xktype=5" % (self._select_info['xn'], self._select_info['xqM'],
-                                                                   self._select_info['xh'], course['kcdm'], course['skbjdm'])
-        _params, token, timestamp = self._encrypt_params(params)
-        r = self._s.post(BNUjwc._cancel_course_url, data={
-            'params': _params,
-            'token': token,
-            'timestamp': timestamp
-        })
-        return json.loads(r.text)
+        return self.submit_prepared(self.prepare_cancel_course(course))
 
     def view_plan_course(self, course):
         """
@@ -602,17 +2532,17 @@ class BNUjwc:
         }, ...]
         """
         self._get_student_info()
-        self._get_select_info()
+        select_info = self._get_select_info()
         params = 'xn=%s&xq_m=%s&xh=%s&kcdm=%s&skbjdm=&xktype=%s&kcfw=zxbnj' \
-                 % (self._select_info['xn'], self._select_info['xqM'],
-                    self._select_info['xh'], course['kcdm'], self._select_info['xktype'])
+                 % (select_info['xn'], select_info['xqM'],
+                    select_info['xh'], course['kcdm'], select_info['xktype'])
         post_data = {
             'initQry': 0,
-            'electiveCourseForm.xktype': self._select_info['xktype'],
-            'electiveCourseForm.xh': self._select_info['xh'],
-            'electiveCourseForm.xn': self._select_info['xn'],
-            'electiveCourseForm.xq': self._select_info['xqM'],
-            'electiveCourseForm.nj': self._select_info['nj'],
+            'electiveCourseForm.xktype': select_info['xktype'],
+            'electiveCourseForm.xh': select_info['xh'],
+            'electiveCourseForm.xn': select_info['xn'],
+            'electiveCourseForm.xq': select_info['xqM'],
+            'electiveCourseForm.nj': select_info['nj'],
             'electiveCourseForm.zydm': self._info['zydm'],
             'electiveCourseForm.kcdm': course['kcdm'],
             'electiveCourseForm.kclb1': course['kclb1'],
@@ -634,63 +2564,66 @@ class BNUjwc:
         }
         return self._get_table_list(BNUjwc._view_planned_course_table_id, post_data, params)
 
-    def select_plan_course(self, course, child_course):
+    def prepare_plan_course(self, course, child_course):
         """
-        select specific planned course
+        build the selection request of specific planned course once
         :param course: course info dict returned by get_plan_courses
         :param child_course: child course info dict returned by view_plan_course
-        :return: {
-            'result': '',
-            'status': '200|400',
-            'message': ''
-        }
+        :return: PreparedSelection for submit_prepared
         """
         self._get_student_info()
-        self._get_select_info()
+        select_info = self._get_select_info()
         params = "xktype=%s&xn=%s&xq=%s&xh=%s&nj=%s&zydm=%s&kcdm=%s&kclb1=%s&kclb2=%s&kclb3=" \
                  "&khfs=%s&skbjdm=%s&skbzdm=&xf=%s&is_checkTime=1&kknj=&kkzydm=&txt_skbjdm=" \
                  "&xk_points=0&is_buy_book=0&is_cx=0&is_yxtj=1&menucode_current=JW130403&kcfw=zxbnj"\
-                 % (self._select_info['xktype'], self._select_info['xn'], self._select_info['xqM'],
-                    self._select_info['xh'], self._select_info['nj'], self._info['zydm'],
+                 % (select_info['xktype'], select_info['xn'], select_info['xqM'],
+                    select_info['xh'], select_info['nj'], self._info['zydm'],
                     course['kcdm'], course['kclb1'], course['kclb2'], course['khfs'], child_course['skbjdm'],
                     course['xf'])
+        return PreparedSelection(self._select_elective_course_url, params, course.get('kc', ''))
 
-        _params, token, timestamp = self._encrypt_params(params)
-        r = self._s.post(BNUjwc._select_elective_course_url, data={
-            'params': _params,
-            'token': token,
-            'timestamp': timestamp
-        })
-        return json.loads(r.text)
-
-    def select_elective_course(self, course):
+    def select_plan_course(self, course, child_course):
         """
-        select specific elective course
-        :param course: course info dict returned by get_elective_courses
+        select specific planned course
+        :param course: course info dict returned by get_plan_courses
+        :param child_course: child course info dict returned by view_plan_course
         :return: {
             'result': '',
             'status': '200|400',
             'message': ''
         }
         """
+        return self.submit_prepared(self.prepare_plan_course(course, child_course))
+
+    def prepare_elective_course(self, course):
+        """
+        build the selection request of specific elective course once
+        :param course: course info dict returned by get_elective_courses
+        :return: PreparedSelection for submit_prepared
+        """
         self._get_student_info()
-        self._get_select_info()
+        select_info = self._get_select_info()
         params = "xktype=%s&initQry=0&xh=%s&xn=%s&xq=%s&nj=%s&zydm=%s&" \
                  "kcdm=%s&kclb1=%s&kclb2=%s&khfs=%s&skbjdm=%s&" \
                  "skbzdm=&xf=%s&kcfw=zxggrx&njzy=%s&items=&is_xjls=undefined&" \
                  "kcmc=&t_skbh=&menucode_current=JW130415"\
-                 % (self._select_info['xktype'], self._select_info['xh'], self._select_info['xn'],
-                    self._select_info['xqM'], self._select_info['nj'], self._info['zydm'],
+                 % (select_info['xktype'], select_info['xh'], select_info['xn'],
+                    select_info['xqM'], select_info['nj'], self._info['zydm'],
                     course['kcdm'], course['kclb1'], course['kclb2'], course['khfs'], course['skbjdm'],
-                    course['xf'], self._select_info['nj'] + '|' + self._info['zydm'])
+                    course['xf'], select_info['nj'] + '|' + self._info['zydm'])
+        return PreparedSelection(self._select_elective_course_url, params, course.get('kc', ''))
 
-        _params, token, timestamp = self._encrypt_params(params)
-        r = self._s.post(BNUjwc._select_elective_course_url, data={
-            'params': _params,
-            'token': token,
-            'timestamp': timestamp
-        })
-        return json.loads(r.text)
+    def select_elective_course(self, course):
+        """
+        select specific elective course
+        :param course: course info dict returned by get_elective_courses
+        :return: {
+            'result': '',
+            'status': '200|400',
+            'message': ''
+        }
+        """
+        return self.submit_prepared(self.prepare_elective_course(course))
 
     def get_selection_result(self):
         """
@@ -723,24 +2656,96 @@ class BNUjwc:
                 '选课方式': '学生网上选'
             }, ...]
         }
+        shared with threads asking at the same time, do not modify it
         """
-        r = self._s.get(BNUjwc._selection_result_url + str(random.random()))
-        self._result_parser.feed(r.text)
-        tables = self._result_parser.tables
+        return self._flights.do(('result',), self._fetch_selection_result)
+
+    def _fetch_selection_result(self):
+        r = self._s.get(self._selection_result_url + str(random.random()))
+        with self._parser('result') as parser, self.stats.phase('parse', 'result'):
+            parser.feed(self._text(r))
+            tables = parser.tables
 
         semester = re.split('\xa0+', tables[0][0][0])
         modules_title = ['模块', '限选学分', '已选学分', '可选学分', '指定学分', '限选门数', '已选门数', '可选门数', '指定门数']
         courses_title = ['序号', '课程', '学分', '类别', '任课教师', '上课班号', '上课班级名称', '选课方式',
                         '已选人数', '限选人数', '可选人数', '上课时间地点', '课程代码']
 
-        module = [dict(zip(modules_title, x)) for x in tables[1]]
-        courses = [dict(zip(courses_title, x)) for x in tables[2]]
+        # the course table is left out when nothing is selected
+        module = [dict(zip(modules_title, x)) for x in tables[1]] if len(tables) > 1 else []
+        courses = [dict(zip(courses_title, x)) for x in tables[2]] if len(tables) > 2 else []
         return {
             'semester': semester,
             'modules': module,
             'courses': courses
         }
 
+    def get_timetable(self):
+        """
+        :return: Timetable of the selected courses, see get_selection_result
+        """
+        return Timetable(self.get_selection_result()['courses'])
+
+    @staticmethod
+    def _parse_server_time(text):
+        fmt = '%Y-%m-%d %H:%M:%S' if text.count(':') == 2 else '%Y-%m-%d %H:%M'
+        return datetime.strptime(text, fmt).replace(tzinfo=BNUjwc._server_tz).timestamp()
+
+    def get_selection_window(self):
+        """
+        get selection time range from select info, or from the selection result page
+        :return: (start, end) as epoch seconds, None if not found
+        """
+        info = self._get_select_info()
+        for start, end in BNUjwc._window_keys:
+            if info.get(start) and info.get(end):
+                try:
+                    return self._parse_server_time(info[start]), self._parse_server_time(info[end])
+                except ValueError:
+                    break
+
+        try:
+            semester = self.get_selection_result()['semester']
+        except (requests.exceptions.RequestException, ValueError, IndexError):
+            return None
+        for text in semester:
+            if '时间区段' not in text:
+                continue
+            m = BNUjwc._window_re.search(text)
+            if m:
+                return self._parse_server_time(m.group(1)), self._parse_server_time(m.group(2))
+        return None
+
+    def get_server_time_offset(self, samples=5):
+        """
+        estimate server clock minus local clock from HTTP Date headers
+        Date has 1s resolution: every sample bounds the offset to
+        [date - received, date + 1 - sent], samples spread over one second narrow the bounds
+        :param samples: number of requests
+        :return: (offset seconds, error seconds)
+        """
+        low, high = float('-inf'), float('inf')
+        estimates = []
+        for i in range(samples):
+            sent = time.time()
+            r = self._s.head(self._clock_url, allow_redirects=False)
+            received = time.time()
+            if 'Date' not in r.headers:
+                continue
+            date = parsedate_to_datetime(r.headers['Date']).timestamp()
+            low = max(low, date - received)
+            high = min(high, date + 1 - sent)
+            estimates.append(date + 0.5 - (sent + received) / 2)
+            if i + 1 < samples:
+                time.sleep(1.0 / samples + 0.013)
+        if not estimates:
+            raise ValueError('server sent no Date header')
+        if low <= high:
+            return (low + high) / 2, (high - low) / 2
+        # inconsistent bounds (e.g. server clock jumped), fall back to the median
+        estimates.sort()
+        return estimates[len(estimates) // 2], 0.5
+
     def get_exam_rounds(self):
         """
         get exam rounds
@@ -749,7 +2754,7 @@ class BNUjwc:
             'name': 'xxx考试', # description
         }, ...]
         """
-        return json.loads(jwc._get_droplist('Ms_KSSW_FBXNXQKSLC'))
+        return json.loads(self._get_droplist('Ms_KSSW_FBXNXQKSLC'))
 
     def get_exam_arragement(self, exam):
         """
@@ -818,9 +2823,10 @@ class BNUjwc:
             post_data['xq'] = semester
 
 
-        r = self._s.post(BNUjwc._exam_score_url, post_data)
-        self._result_parser.feed(r.text, True)
-        tables = self._result_parser.tables
+        r = self._s.post(self._exam_score_url, post_data, idempotent=True)
+        with self._parser('result') as parser, self.stats.phase('parse', 'scores'):
+            parser.feed(self._text(r), True)
+            tables = parser.tables
         title = ['学年学期', '课程/环节', '学分', '类别', '修读性质', '平时成绩', '期末成绩', '综合成绩', '辅修标记', '备注']
         semester_title = ''
         scores = []
@@ -854,9 +2860,10 @@ class BNUjwc:
         post_data = {
             'pjzt_m': 20
         }
-        r = self._s.post(BNUjwc._evaluate_list_url, post_data)
-        m = re.findall(r'<option value=\'({.*?})\'>(.*?)</option>', r.text)
-        return [json.loads(data) for data, name in m]
+        r = self._s.post(self._evaluate_list_url, post_data, idempotent=True)
+        with self.stats.phase('parse', 'evaluate_list'):
+            m = re.findall(r'<option value=\'({.*?})\'>(.*?)</option>', self._text(r))
+            return [json.loads(data) for data, name in m]
 
     def get_evaluate_course_list(self, evaluate):
         """
@@ -888,22 +2895,23 @@ class BNUjwc:
             'menucode_current': '',
         }
 
-        r = self._s.post(BNUjwc._table_url + BNUjwc._evaluate_course_list_table_id, data=post_data)
-        m = re.findall(r'parent.jxpj\("(.*?)","', r.text)
-        m = ','.join(m).replace('\\\"', '\"')
-        m = '[' + m + ']'
-        return json.loads(m)
+        r = self._s.post(self._table_url + BNUjwc._evaluate_course_list_table_id, data=post_data, idempotent=True)
+        with self.stats.phase('parse', 'evaluate_course_list'):
+            m = re.findall(r'parent.jxpj\("(.*?)","', self._text(r))
+            m = ','.join(m).replace('\\\"', '\"')
+            m = '[' + m + ']'
+            return json.loads(m)
 
-    def evaluate_course(self, evaluate, course, score=5):
+    def _evaluate_form_key(self, course):
         """
-        evaluate specific course
-        param evaluate: evaluate round from get_evaluate_list
-        param course: evaluate course from get_evaluate_course_list
-        return: {'status': '200', 'result': None, 'message': '操作成功!'}
+        forms of one template have the same items
         """
+        return course['pjlb_m'], BNUjwc._evaluate_zbmb_m, BNUjwc._evaluate_wjmb_m
 
-        self._get_student_info()
-
+    def _fetch_evaluate_form(self, evaluate, course):
+        """
+        :return: (codes of the choice items, tmbh of the text items)
+        """
         get_data = {
             'jsid': course['jsid'],
             'sfzjjs': course['sfzjjs'],
@@ -927,19 +2935,23 @@ class BNUjwc:
             'skbjdm': course['skbjdm'],
         }
 
-        r = self._s.get(BNUjwc._evaluate_form_url, params=get_data)
-        self._evaluate_parser.feed(r.text)
+        r = self._s.get(self._evaluate_form_url, params=get_data)
+        with self._parser('evaluate') as parser, self.stats.phase('parse', 'evaluate_form'):
+            parser.feed(self._text(r))
+            return tuple(sorted(parser.select)), tuple(sorted(parser.text))
 
+    def _save_evaluation(self, evaluate, course, form, score):
+        select, text = form
         if score > 5:
             score = 5
         elif score < 1:
             score = 1
 
-        commit = ';'.join([str(score) + '@' + x + '@0' + str(6 - score) for x in self._evaluate_parser.select])
+        commit = ';'.join([str(score) + '@' + x + '@0' + str(6 - score) for x in select])
         commit = urllib.parse.quote(urllib.parse.quote(commit))
 
         commitText = []
-        for x in self._evaluate_parser.text:
+        for x in text:
             if score < 2:
                 commitText.append(x + '@#@优点很少，收获不多，建议老师充分调动课堂，创新教学方式，继续努力')
             else:
@@ -959,8 +2971,8 @@ class BNUjwc:
             'wspjZbpjWjdcForm.skbjdm': course['skbjdm'],
             'wspjZbpjWjdcForm.pjfsbz': evaluate['pjfsbz'],
             'wspjZbpjWjdcForm.jsid': course['jsid'],
-            'wspjZbpjWjdcForm.zbmb_m': '005',
-            'wspjZbpjWjdcForm.wjmb_m': '002',
+            'wspjZbpjWjdcForm.zbmb_m': BNUjwc._evaluate_zbmb_m,
+            'wspjZbpjWjdcForm.wjmb_m': BNUjwc._evaluate_wjmb_m,
             'wspjZbpjWjdcForm.commitZB': commit,
             'wspjZbpjWjdcForm.commitWJText': commitText,
             'wspjZbpjWjdcForm.commitWJSelect': '',
@@ -968,8 +2980,573 @@ class BNUjwc:
             'menucode_current': '',
         }
 
-        r = self._s.post(BNUjwc._evaluate_save_url, data=post_data)
-        return json.loads(r.text)
+        r = self._s.post(self._evaluate_save_url, data=post_data)
+        return json.loads(self._text(r))
+
+    def evaluate_course(self, evaluate, course, score=5):
+        """
+        evaluate specific course
+        param evaluate: evaluate round from get_evaluate_list
+        param course: evaluate course from get_evaluate_course_list
+        return: {'status': '200', 'result': None, 'message': '操作成功!'}
+        """
+
+        self._get_student_info()
+        form = self._fetch_evaluate_form(evaluate, course)
+        return self._save_evaluation(evaluate, course, form, score)
+
+    def evaluate_all(self, evaluate, score=5, courses=None, workers=None):
+        """
+        evaluate every course of a round; the form of each template is fetched and parsed once per call,
+        then all evaluations are saved on a bounded pool of threads
+        param evaluate: evaluate round from get_evaluate_list
+        param score: 1 ~ 5 for every course
+        param courses: courses from get_evaluate_course_list, all of the round if None
+        param workers: requests in flight at most, read_workers by default
+        return: [{
+            'course': {...}, # from get_evaluate_course_list
+            'result': {'status': '200', 'result': None, 'message': '操作成功!'}, # None if failed
+            'error': '', # why it failed
+            'seconds': 0.05, # time spent on this course, including the form fetch if it was not cached
+        }, ...] in the order of courses
+        """
+        self._get_student_info()
+        if courses is None:
+            courses = self.get_evaluate_course_list(evaluate)
+
+        # one course per form template fetches its form first, the others of this call reuse it
+        first = {}
+        for course in courses:
+            first.setdefault(self._evaluate_form_key(course), course)
+        # (pjlb_m, zbmb_m, wjmb_m) -> items of the evaluation form
+        forms = {}
+
+        def fetch(course):
+            start = time.perf_counter()
+            form = self._fetch_evaluate_form(evaluate, course)
+            # a form without choice items is not shared, each course of its template fetches its own
+            if form[0]:
+                forms[self._evaluate_form_key(course)] = form
+            return time.perf_counter() - start
+
+        def save(course, extra):
+            start = time.perf_counter()
+            item = {'course': course, 'result': None, 'error': ''}
+            key = self._evaluate_form_key(course)
+            if key in errors:
+                item['error'] = errors[key]
+            else:
+                try:
+                    form = forms.get(key) or self._fetch_evaluate_form(evaluate, course)
+                    item['result'] = self._save_evaluation(evaluate, course, form, score)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    item['error'] = str(e)
+            item['seconds'] = time.perf_counter() - start + extra
+            return item
+
+        with self._workers(workers) as executor:
+            spent = {}
+            errors = {}
+            futures = {key: executor.submit(fetch, course) for key, course in first.items()}
+            for key, future in futures.items():
+                try:
+                    spent[id(first[key])] = future.result()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    errors[key] = '获取评教表失败：%s' % e
+            futures = [executor.submit(save, course, spent.get(id(course), 0.0)) for course in courses]
+            return [x.result() for x in futures]
+
+
+class AsyncBNUjwc:
+    """
+    asyncio variant of BNUjwc
+
+    Every public method of BNUjwc is available as a coroutine.  Calls run the
+    blocking client on a bounded thread pool, each thread sending through a
+    session and connection pool of its own over the shared cookie jar, so
+    independent reads overlap, e.g.
+
+        plan, elective, result = await asyncio.gather(
+            jwc.get_plan_courses(True), jwc.get_elective_courses(True), jwc.get_selection_result())
+    """
+    _methods = ['login', 'ensure_login', 'ready_for_threading',
+                'get_plan_courses', 'get_cancel_courses', 'get_elective_courses', 'get_catalog',
+                'find_plan_course', 'find_elective_course', 'view_plan_course',
+                'prepare_cancel_course', 'prepare_plan_course', 'prepare_elective_course',
+                'submit_prepared', 'cancel_course', 'select_plan_course', 'select_elective_course',
+                'get_selection_result', 'get_selection_window', 'get_timetable',
+                'get_exam_rounds', 'get_exam_arragement', 'get_exam_scores',
+                'get_evaluate_list', 'get_evaluate_course_list', 'evaluate_course', 'evaluate_all']
+
+    def __init__(self, username, password, concurrency=4, **kwargs):
+        """
+        :param username: username (student id)
+        :param password: password (default: birthday - yyyymmdd)
+        :param concurrency: max number of requests in flight
+        :param kwargs: other BNUjwc arguments
+        """
+        self.jwc = BNUjwc(username, password, **kwargs)
+        self.concurrency = concurrency
+        # the executor bounds the calls in flight, more wait in its queue
+        self._executor = ThreadPoolExecutor(concurrency)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def get_cookies(self):
+        return self.jwc.get_cookies()
+
+    def set_cookies(self, cookies):
+        self.jwc.set_cookies(cookies)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.jwc.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+def _async_method(name):
+    func = getattr(BNUjwc, name)
+
+    async def method(self, *args, **kwargs):
+        return await self._run(getattr(self.jwc, name), *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = func.__doc__
+    return method
+
+
+for _name in AsyncBNUjwc._methods:
+    setattr(AsyncBNUjwc, _name, _async_method(_name))
+
+
+class GrabTask:
+    """
+    one wishlist entry in GrabScheduler
+    """
+    def __init__(self, prepared, priority=0, name='', mask=0, skbjdm=''):
+        self.prepared = prepared
+        self.priority = priority
+        self.name = name or prepared.name
+        self.mask = mask
+        self.skbjdm = skbjdm
+        self.state = GrabScheduler.PENDING
+        self.attempts = 0
+        self.result = None
+        self.next_time = 0
+
+    def __repr__(self):
+        return 'GrabTask(%r, %s, attempts=%d)' % (self.name, self.state, self.attempts)
+
+
+class GrabScheduler:
+    """
+    grab wishlist courses with per-course state and AIMD pacing
+
+    Tasks wait in a priority queue ordered by (next attempt time, priority).
+    The request rate grows additively after every answer that is not
+    throttled and is cut multiplicatively when the server answers status 300,
+    so it settles just below the rate the server accepts.
+    Full courses are retried after full_delay seconds, invalid (e.g. time
+    conflict) and done courses leave the queue.  With a timetable, courses
+    overlapping it are invalid from the start, and a grabbed course takes its
+    periods so pending courses overlapping it leave the queue unsent.
+    """
+    PENDING = 'pending'
+    FULL = 'full'
+    INVALID = 'invalid'
+    DONE = 'done'
+
+    THROTTLED = '300'
+    _full_markers = ('人数已满', '超过限选人数')
+    # not the bare '已选', which is also part of '已选人数' in messages about full courses
+    _done_markers = ('该课程已选', '已选中', '已经选', '重复选')
+    # other '已满' messages (e.g. '学分已满', '门数已满') are limits of the student, not of the course
+    _invalid_markers = ('冲突', '超出', '超过', '不允许', '不能选', '已达', '已满')
+
+    def __init__(self, jwc, interval=1.2, min_interval=0.2, max_interval=10.0, increase=0.05, decrease=0.5,
+                 full_delay=3.0, on_result=None, timetable=None, clock=time.monotonic, sleep=time.sleep,
+                 wall_clock=time.time):
+        """
+        :param jwc: logged in BNUjwc
+        :param interval: seconds between requests at start
+        :param min_interval: fastest pace
+        :param max_interval: slowest pace
+        :param increase: requests/s added to the rate after each answer which is not throttled
+        :param decrease: factor applied to the rate when throttled
+        :param full_delay: seconds before retrying a full course
+        :param on_result: callback(task, result, throttled) after each attempt
+        :param timetable: Timetable of the selected courses (see BNUjwc.get_timetable), None to send every course
+        :param clock: monotonic clock used for pacing and waiting
+        :param sleep: sleep between requests
+        :param wall_clock: epoch clock, only read once by run_at to place start on clock
+        """
+        self.jwc = jwc
+        self.timetable = timetable
+        self.rate = 1.0 / interval
+        self.min_rate = 1.0 / max_interval
+        self.max_rate = 1.0 / min_interval
+        self.increase = increase
+        self.decrease = decrease
+        self.full_delay = full_delay
+        self.on_result = on_result
+        self.tasks = []
+        self.stats = {'attempts': 0, 'throttled': 0, 'errors': 0}
+        self._clock = clock
+        self._sleep = sleep
+        self._wall_clock = wall_clock
+        self._queue = []
+        self._seq = itertools.count()
+        self._last_send = None
+        self._stop = threading.Event()
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate
+
+    def add(self, prepared, priority=0, name='', mask=0, skbjdm=''):
+        """
+        :param prepared: PreparedSelection
+        :param priority: lower goes first
+        :param mask: schedule bitmask of the course, see course_mask
+        :param skbjdm: section code, a section already in the timetable is done at once
+        :return: GrabTask
+        """
+        task = GrabTask(prepared, priority, name, mask, skbjdm)
+        self.tasks.append(task)
+        if self.timetable is not None and skbjdm and skbjdm in self.timetable:
+            task.state = GrabScheduler.DONE
+            task.result = {'status': '', 'result': None, 'message': '已选中'}
+        elif self.timetable is not None and self.timetable.conflicts(mask):
+            self._conflict(task, self.timetable.conflicting(mask))
+        else:
+            self._push(task)
+        return task
+
+    def add_elective(self, course, priority=0):
+        return self.add(self.jwc.prepare_elective_course(course), priority,
+                        mask=course_mask(course), skbjdm=course.get('skbjdm', ''))
+
+    def add_plan(self, course, child_course, priority=0):
+        return self.add(self.jwc.prepare_plan_course(course, child_course), priority,
+                        mask=course_mask(child_course) or course_mask(course), skbjdm=child_course.get('skbjdm', ''))
+
+    @staticmethod
+    def _conflict(task, names):
+        task.state = GrabScheduler.INVALID
+        task.result = {'status': '', 'result': None, 'message': '时间冲突：' + '，'.join(names)}
+
+    def _take(self, task):
+        # the grabbed course takes its periods, pending courses overlapping them can not be selected any more
+        self.timetable.add(task.mask, task.skbjdm or task.name)
+        kept = []
+        for entry in self._queue:
+            if entry[3].mask & task.mask:
+                self._conflict(entry[3], [task.name])
+            else:
+                kept.append(entry)
+        if len(kept) < len(self._queue):
+            heapq.heapify(kept)
+            self._queue = kept
+
+    def _push(self, task):
+        heapq.heappush(self._queue, (task.next_time, task.priority, next(self._seq), task))
+
+    def pending(self):
+        """
+        :return: tasks still in the queue
+        """
+        return [x[3] for x in self._queue]
+
+    @classmethod
+    def classify(cls, ret):
+        """
+        :param ret: result of a selection request
+        :return: (state, throttled)
+        """
+        status = str(ret.get('status', ''))
+        message = str(ret.get('message', ''))
+        if status == cls.THROTTLED:
+            return cls.PENDING, True
+        if status == '200':
+            return cls.DONE, False
+        if any(x in message for x in cls._full_markers):
+            return cls.FULL, False
+        if any(x in message for x in cls._done_markers):
+            return cls.DONE, False
+        if any(x in message for x in cls._invalid_markers):
+            return cls.INVALID, False
+        # e.g. '非有效' before the selection time, keep trying
+        return cls.PENDING, False
+
+    def _pace(self, throttled):
+        if throttled:
+            self.stats['throttled'] += 1
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+        else:
+            self.rate = min(self.rate + self.increase, self.max_rate)
+
+    def step(self):
+        """
+        wait for the next due task and attempt it once
+        :return: (task, result), None if the queue is empty
+        """
+        if not self._queue:
+            return None
+        next_time, _, _, task = heapq.heappop(self._queue)
+        now = self._clock()
+        due = next_time
+        if self._last_send is not None:
+            due = max(due, self._last_send + self.interval)
+        if due > now:
+            self._sleep(due - now)
+
+        self._last_send = self._clock()
+        task.attempts += 1
+        self.stats['attempts'] += 1
+        try:
+            ret = self.jwc.submit_prepared(task.prepared)
+            task.state, throttled = self.classify(ret)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # timed out, dropped or not JSON (e.g. a 5xx page during the rush):
+            # unknown whether the server took it, try again at a slower pace
+            ret = {'status': '', 'result': None, 'message': '请求失败：%s' % e}
+            task.state, throttled = GrabScheduler.PENDING, True
+            self.stats['errors'] += 1
+        task.result = ret
+        self._pace(throttled)
+
+        if task.state == GrabScheduler.DONE and self.timetable is not None and task.mask:
+            # '已选' answers mean an earlier selection, whose periods the timetable already has
+            if str(ret.get('status')) == '200':
+                self._take(task)
+        elif task.state == GrabScheduler.FULL:
+            task.next_time = self._clock() + self.full_delay
+            self._push(task)
+        elif task.state == GrabScheduler.PENDING:
+            task.next_time = self._clock()
+            self._push(task)
+
+        if self.on_result:
+            self.on_result(task, ret, throttled)
+        return task, ret
+
+    def run(self, max_attempts=None):
+        """
+        grab until every task is done or invalid, stop() is called or max_attempts is reached
+        :return: all tasks
+        """
+        self._stop.clear()
+        attempts = 0
+        while self._queue and not self._stop.is_set():
+            if max_attempts is not None and attempts >= max_attempts:
+                break
+            self.step()
+            attempts += 1
+        return self.tasks
+
+    def warm(self):
+        """
+        open keep-alive connections, fetch a fresh _deskey and encrypt every prepared request with it
+        """
+        self.jwc.warm_connections()
+        self.jwc.invalidate_deskey()
+        deskey = self.jwc._get_deskey()
+        for task in self.pending():
+            task.prepared.encrypt(self.jwc._des, deskey)
+
+    def run_at(self, start, offset=0.0, warm_lead=3.0, early=0.0, max_attempts=None):
+        """
+        warm up before the selection window opens and send the first request as soon as it opens
+        :param start: window opening time, epoch seconds of the server clock (see get_selection_window)
+        :param offset: server clock minus local clock (see get_server_time_offset)
+        :param warm_lead: seconds before start to refresh _deskey, connections and payloads
+        :param early: seconds to send before start, e.g. half the round trip time
+        :return: all tasks
+        """
+        self._stop.clear()
+        # start is epoch time, wait on the monotonic clock which does not jump
+        target = self._clock() + (start - offset - early - self._wall_clock())
+        # stop() wakes up both waits
+        if self._stop.wait(max(target - warm_lead - self._clock(), 0)):
+            return self.tasks
+        self.warm()
+        # coarse wait, then spin for the last few milliseconds
+        while True:
+            wait = target - self._clock()
+            if wait <= 0:
+                break
+            if self._stop.wait(wait - 0.005 if wait > 0.01 else 0):
+                return self.tasks
+        self._last_send = None
+        return self.run(max_attempts)
+
+    def stop(self):
+        self._stop.set()
+
+
+def _to_int(value):
+    m = re.match(r'\s*(-?\d+)', str(value or ''))
+    return int(m.group(1)) if m else None
+
+
+def seat_counts(row):
+    """
+    seat fields of a row from get_elective_courses, view_plan_course or get_selection_result
+    :return: (selected, capacity, free), None for unknown fields
+    """
+    if '可选人数' in row or '限选人数' in row:
+        selected, capacity, free = row.get('已选人数'), row.get('限选人数'), row.get('可选人数')
+    elif 'xkrssx' in row:
+        selected, capacity, free = row.get('xkrs'), row.get('xkrssx'), row.get('kxrs')
+    else:
+        selected, capacity, free = row.get('yxrs'), row.get('xxrs'), row.get('kxrs')
+    selected, capacity, free = _to_int(selected), _to_int(capacity), _to_int(free)
+    if free is None and selected is not None and capacity is not None:
+        free = capacity - selected
+    return selected, capacity, free
+
+
+class VacancyWatcher:
+    """
+    watch seat counts of full courses and send a selection only when a seat frees up
+
+    Each round reads the elective list (streamed, stopping once every watched
+    section is seen), view_plan_course of every watched planned course and
+    the selection result, instead of one encrypted POST per course.
+    """
+    def __init__(self, jwc, interval=2.0, on_change=None, on_result=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param jwc: logged in BNUjwc
+        :param interval: seconds between rounds
+        :param on_change: callback(task, old seats, new seats) when seat counts change
+        :param on_result: callback(task, result) after each selection attempt
+        """
+        self.jwc = jwc
+        self.interval = interval
+        self.on_change = on_change
+        self.on_result = on_result
+        self.tasks = []
+        self.seats = {}
+        self.stats = {'rounds': 0, 'attempts': 0, 'errors': 0}
+        self._clock = clock
+        self._sleep = sleep
+        self._stop = threading.Event()
+
+    def _add(self, prepared, kind, course, child_course, priority):
+        task = GrabTask(prepared, priority)
+        task.kind = kind
+        task.course = course
+        task.skbjdm = (child_course or course)['skbjdm']
+        self.tasks.append(task)
+        return task
+
+    def watch_elective(self, course, priority=0):
+        return self._add(self.jwc.prepare_elective_course(course), 'elective', course, None, priority)
+
+    def watch_plan(self, course, child_course, priority=0):
+        return self._add(self.jwc.prepare_plan_course(course, child_course), 'plan', course, child_course, priority)
+
+    def pending(self):
+        return [x for x in self.tasks if x.state in (GrabScheduler.PENDING, GrabScheduler.FULL)]
+
+    def _read_seats(self, tasks):
+        """
+        :return: {skbjdm: (selected, capacity, free)} of watched sections
+        """
+        wanted = {x.skbjdm for x in tasks}
+        seats = {}
+
+        elective = {x.skbjdm for x in tasks if x.kind == 'elective'}
+        if elective:
+            for row in self.jwc.get_elective_courses(True, stream=True):
+                if row.get('skbjdm') in elective:
+                    seats[row['skbjdm']] = seat_counts(row)
+                    if elective <= seats.keys():
+                        break
+
+        viewed = set()
+        for task in tasks:
+            if task.kind == 'plan' and task.course['kcdm'] not in viewed:
+                viewed.add(task.course['kcdm'])
+                for row in self.jwc.view_plan_course(task.course):
+                    if row.get('skbjdm') in wanted:
+                        seats[row['skbjdm']] = seat_counts(row)
+
+        # sections already in the selection result are done
+        for row in self.jwc.get_selection_result()['courses']:
+            if row.get('课程代码') in wanted:
+                seats[row['课程代码']] = None
+        return seats
+
+    def poll(self):
+        """
+        one round: read seats, attempt every watched section with a free seat
+        :return: [(task, result), ...] of attempts
+        """
+        tasks = self.pending()
+        self.stats['rounds'] += 1
+        try:
+            seats = self._read_seats(tasks)
+        except (requests.exceptions.RequestException, ValueError):
+            # the read timed out even after retries or was no course list, try again next round
+            self.stats['errors'] += 1
+            return []
+        attempts = []
+        for task in sorted(tasks, key=lambda x: x.priority):
+            if task.skbjdm in seats and seats[task.skbjdm] is None:
+                task.state = GrabScheduler.DONE
+                continue
+            new = seats.get(task.skbjdm)
+            old = self.seats.get(task.skbjdm)
+            self.seats[task.skbjdm] = new
+            if new != old and self.on_change:
+                self.on_change(task, old, new)
+            if new is None or new[2] is None or new[2] <= 0:
+                task.state = GrabScheduler.FULL
+                continue
+
+            task.attempts += 1
+            self.stats['attempts'] += 1
+            try:
+                ret = self.jwc.submit_prepared(task.prepared)
+                task.state, _ = GrabScheduler.classify(ret)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                ret = {'status': '', 'result': None, 'message': '请求失败：%s' % e}
+                task.state = GrabScheduler.PENDING
+                self.stats['errors'] += 1
+            task.result = ret
+            attempts.append((task, ret))
+            if self.on_result:
+                self.on_result(task, ret)
+        return attempts
+
+    def run(self, max_rounds=None):
+        """
+        poll until every task is done or invalid, stop() is called or max_rounds is reached
+        :return: all tasks
+        """
+        self._stop.clear()
+        rounds = 0
+        while self.pending() and not self._stop.is_set():
+            if max_rounds is not None and rounds >= max_rounds:
+                break
+            start = self._clock()
+            self.poll()
+            rounds += 1
+            wait = self.interval - (self._clock() - start)
+            if wait > 0 and self.pending():
+                self._sleep(wait)
+        return self.tasks
+
+    def stop(self):
+        self._stop.set()
 
 
 if __name__ == '__main__':
@@ -989,15 +3566,14 @@ if __name__ == '__main__':
     with open('user.txt', 'r') as f:
         username = f.readline().strip()
         pwd = f.readline().strip()
-        jwc = BNUjwc(username, pwd)
+        jwc = BNUjwc(username, pwd, snapshot='snapshot.db')
 
-    logined = False
-    while not logined:
-        try:
-            jwc.login()
-            logined = True
-        except Exception:
-            logined = False
+    try:
+        if jwc.ensure_login():
+            print('沿用上次的登录状态')
+    except PasswordError:
+        print('用户名或密码错误，请检查 user.txt')
+        sys.exit(1)
 
     print('登录成功!')
 
@@ -1097,9 +3673,9 @@ if __name__ == '__main__':
         if j == -1:
             return
         elif j == -2:
-             for j, x in enumerate(course):
-                print(jwc.evaluate_course(evaluate[i], x))
-             return
+            for x in jwc.evaluate_all(evaluate[i], 5, course):
+                print(x['course']['kcmc'], x['course']['xm'], x['result'] or x['error'])
+            return
         print("请输入分值(1 ~ 5):")
         score = int(input())
         print(jwc.evaluate_course(evaluate[i], course[j], score))
@@ -1113,16 +3689,8 @@ if __name__ == '__main__':
         for x in wishlist['elective']:
             print(x)
 
-    def add_by_plan():
-        courses = jwc.get_plan_courses(True)
-        for i, course in enumerate(courses):
-            print(i, course)
-        print('输入 -1 则退出')
-        print('请输入课程序号以查看详情')
-        i = int(input())
-        if i == -1:
-            return
-        child_courses = jwc.view_plan_course(courses[i])
+    def add_plan_course(course):
+        child_courses = jwc.view_plan_course(course)
         for j, child_course in enumerate(child_courses):
             print(j, child_course)
         print('输入 -1 则退出')
@@ -1130,11 +3698,22 @@ if __name__ == '__main__':
         j = int(input())
         if j == -1:
             return
-        wishlist['plan'].append((courses[i], child_courses[j]))
+        wishlist['plan'].append((course, child_courses[j]))
         print("已添加")
 
+    def add_by_plan():
+        courses = jwc.get_catalog().by_source('plan')
+        for i, course in enumerate(courses):
+            print(i, course)
+        print('输入 -1 则退出')
+        print('请输入课程序号以查看详情')
+        i = int(input())
+        if i == -1:
+            return
+        add_plan_course(courses[i])
+
     def add_by_elective():
-        courses = jwc.get_elective_courses(True)
+        courses = jwc.get_catalog().by_source('elective')
         for i, course in enumerate(courses):
             print(i, course)
         print('输入 -1 则退出')
@@ -1145,50 +3724,106 @@ if __name__ == '__main__':
         wishlist['elective'].append(courses[i])
         print("已添加")
 
+    def add_by_search():
+        catalog = jwc.get_catalog()
+        print('请输入课程代码、上课班号、教师或课程名称:')
+        courses = catalog.find(input().strip())
+        for i, course in enumerate(courses):
+            print(i, catalog.source_of(course), course)
+        print('输入 -1 则退出')
+        print('请输入课程序号以添加')
+        i = int(input())
+        if i == -1:
+            return
+        if catalog.source_of(courses[i]) == 'plan':
+            add_plan_course(courses[i])
+        else:
+            wishlist['elective'].append(courses[i])
+            print("已添加")
+
+    def print_skipped(scheduler):
+        # already selected or overlapping the timetable, never sent
+        for task in scheduler.tasks:
+            if task.state != GrabScheduler.PENDING:
+                print(task.name, task.result['message'], '不再抢课.')
+
     def grab_courses():
+        jwc.ready_for_threading(warm_select_info=True)
+
+        def on_result(task, ret, throttled):
+            if throttled:
+                print(task.name, '本次抢课失败, 重新加入抢课队列. 原因: 抢课过快, 调整间隔时间为',
+                      round(scheduler.interval, 2), '秒')
+            elif task.state == GrabScheduler.FULL:
+                print(task.name, ret['message'], '稍后重试, 等待有人退课.')
+            elif task.state == GrabScheduler.PENDING:
+                print(task.name, ret['message'], '重新加入抢课队列.')
+            else:
+                print(task.name, ret['message'])
 
-        worklist = {
-            'elective': wishlist['elective'][:],
-            'plan': wishlist['plan'][:],
-        }
+        scheduler = GrabScheduler(jwc, on_result=on_result, timetable=jwc.get_timetable())
+        # elective courses first, then planning courses, both in wishlist order
+        for i, course in enumerate(wishlist['elective']):
+            scheduler.add_elective(course, (0, i))
+        for i, (course, child_course) in enumerate(wishlist['plan']):
+            scheduler.add_plan(course, child_course, (1, i))
+        print_skipped(scheduler)
 
-        sleep_time = 1.2
-        print('默认抢课间隔时间为', sleep_time, '秒')
-        while len(worklist['elective']) + len(worklist['plan']):
-            for course in worklist['elective'][:]:
-                ret = jwc.select_elective_course(course)
-                if ret['status'] == '300':
-                    sleep_time += .2
-                    print(course['kc'], '本次抢课失败, 重新加入抢课队列. 原因: 抢课过快, 延长间隔时间为', sleep_time, '秒')
-                elif ret['message'].find('人数已满') != -1:
-                    print(course['kc'], ret['message'], '重新加入抢课队列, 等待有人退课.')
-                elif ret['message'].find('非有效') != -1:
-                    print(course['kc'], ret['message'], '重新加入抢课队列.')
-                else:
-                    #worklist['elective'].remove(course)
-                    print(course['kc'], ret['message'])
-                if len(worklist['elective']) + len(worklist['plan']):
-                    time.sleep(sleep_time)
-            for course in worklist['plan'][:]:
-                ret = jwc.select_plan_course(course[0], course[1])
-                if ret['status'] == '300':
-                    sleep_time += .2
-                    print(course[0]['kc'], '抢课过快,延长间隔时间为', sleep_time, '秒')
-                elif ret['message'].find('人数已满') != -1:
-                    print(course[0]['kc'], ret['message'], '重新加入抢课队列, 等待有人退课.')
-                elif ret['message'].find('非有效') != -1:
-                    print(course[0]['kc'], ret['message'], '重新加入抢课队列.')
-                else:
-                    #worklist['plan'].remove(course)
-                    print(course[0]['kc'], ret['message'])
-                if len(worklist['elective']) + len(worklist['plan']):
-                    time.sleep(sleep_time)
+        print('默认抢课间隔时间为', scheduler.interval, '秒')
+        scheduler.run()
+
+        print("完成")
+
+    def grab_courses_on_time():
+        jwc.ready_for_threading(warm_select_info=True)
+        window = jwc.get_selection_window()
+        if window is None:
+            print('未找到选课时间区段, 请输入开始时间(例如 2016-01-05 20:00):')
+            start = BNUjwc._parse_server_time(input().strip())
+        else:
+            start = window[0]
+        offset, error = jwc.get_server_time_offset()
+        print('选课开始时间:', datetime.fromtimestamp(start, BNUjwc._server_tz).strftime('%Y-%m-%d %H:%M:%S'))
+        print('服务器时间偏差: %.3f 秒 (误差 ±%.3f 秒)' % (offset, error))
+
+        def on_result(task, ret, throttled):
+            print(task.name, ret['message'])
+
+        scheduler = GrabScheduler(jwc, on_result=on_result, timetable=jwc.get_timetable())
+        for i, course in enumerate(wishlist['elective']):
+            scheduler.add_elective(course, (0, i))
+        for i, (course, child_course) in enumerate(wishlist['plan']):
+            scheduler.add_plan(course, child_course, (1, i))
+        print_skipped(scheduler)
+        print('等待开始…')
+        scheduler.run_at(start, offset)
+
+        print("完成")
+
+    def watch_courses():
+        jwc.ready_for_threading(warm_select_info=True)
+
+        def on_change(task, old, new):
+            if new:
+                print(task.name, '已选/限选/可选:', new)
+
+        def on_result(task, ret):
+            print(task.name, ret['message'])
+
+        watcher = VacancyWatcher(jwc, on_change=on_change, on_result=on_result)
+        for i, course in enumerate(wishlist['elective']):
+            watcher.watch_elective(course, (0, i))
+        for i, (course, child_course) in enumerate(wishlist['plan']):
+            watcher.watch_plan(course, child_course, (1, i))
+
+        print('监视余量中, 每', watcher.interval, '秒查询一次')
+        watcher.run()
 
         print("完成")
 
     def bye():
         with open("wishlist.txt", "w+") as f:
-            f.write(json.dumps(wishlist,ensure_ascii=False))
+            f.write(json.dumps(wishlist,ensure_ascii=False,default=to_json))
         print("已保存愿望单")
         print("再见")
         exit()
@@ -1238,9 +3873,12 @@ if __name__ == '__main__':
         print("- 添加愿望课程")
         print("\ta: 自开课计划")
         print("\tb: 自公选课")
+        print("\td: 搜索课程")
         print("\tc: 查看愿望单")
         print("- 抢课")
         print("\tQ: 开始抢课")
+        print("\tW: 监视余量抢课")
+        print("\tS: 定时抢课(选课开放时自动开始)")
         print("\n7: 退出\n")
 
         cmd = input()
@@ -1255,8 +3893,11 @@ if __name__ == '__main__':
             "6": evaluate_teachers,
             "a": add_by_plan,
             "b": add_by_elective,
+            "d": add_by_search,
             "c": view_wishlist,
             "Q": grab_courses,
+            "W": watch_courses,
+            "S": grab_courses_on_time,
             "7": bye,
         }
 
@@ -0,0 +1,273 @@
+"""
+Native Python port of des.js (strEnc / strDec)
+
+des.js treats every 4 UTF-16 code units of the data (and of the key) as one
+64-bit block and chains one DES pass per 4-char key block.  Its key schedule
+is not the textbook PC-1, so the subkeys are derived exactly as des.js does
+and cached per key; the rounds themselves run on integers with precomputed
+permutation and S/P tables.
+"""
+from functools import lru_cache
+
+
+_S_BOXES = [
+    [[14, 4, 13, 1, 2, 15, 11, 8, 3, 10, 6, 12, 5, 9, 0, 7],
+     [0, 15, 7, 4, 14, 2, 13, 1, 10, 6, 12, 11, 9, 5, 3, 8],
+     [4, 1, 14, 8, 13, 6, 2, 11, 15, 12, 9, 7, 3, 10, 5, 0],
+     [15, 12, 8, 2, 4, 9, 1, 7, 5, 11, 3, 14, 10, 0, 6, 13]],
+    [[15, 1, 8, 14, 6, 11, 3, 4, 9, 7, 2, 13, 12, 0, 5, 10],
+     [3, 13, 4, 7, 15, 2, 8, 14, 12, 0, 1, 10, 6, 9, 11, 5],
+     [0, 14, 7, 11, 10, 4, 13, 1, 5, 8, 12, 6, 9, 3, 2, 15],
+     [13, 8, 10, 1, 3, 15, 4, 2, 11, 6, 7, 12, 0, 5, 14, 9]],
+    [[10, 0, 9, 14, 6, 3, 15, 5, 1, 13, 12, 7, 11, 4, 2, 8],
+     [13, 7, 0, 9, 3, 4, 6, 10, 2, 8, 5, 14, 12, 11, 15, 1],
+     [13, 6, 4, 9, 8, 15, 3, 0, 11, 1, 2, 12, 5, 10, 14, 7],
+     [1, 10, 13, 0, 6, 9, 8, 7, 4, 15, 14, 3, 11, 5, 2, 12]],
+    [[7, 13, 14, 3, 0, 6, 9, 10, 1, 2, 8, 5, 11, 12, 4, 15],
+     [13, 8, 11, 5, 6, 15, 0, 3, 4, 7, 2, 12, 1, 10, 14, 9],
+     [10, 6, 9, 0, 12, 11, 7, 13, 15, 1, 3, 14, 5, 2, 8, 4],
+     [3, 15, 0, 6, 10, 1, 13, 8, 9, 4, 5, 11, 12, 7, 2, 14]],
+    [[2, 12, 4, 1, 7, 10, 11, 6, 8, 5, 3, 15, 13, 0, 14, 9],
+     [14, 11, 2, 12, 4, 7, 13, 1, 5, 0, 15, 10, 3, 9, 8, 6],
+     [4, 2, 1, 11, 10, 13, 7, 8, 15, 9, 12, 5, 6, 3, 0, 14],
+     [11, 8, 12, 7, 1, 14, 2, 13, 6, 15, 0, 9, 10, 4, 5, 3]],
+    [[12, 1, 10, 15, 9, 2, 6, 8, 0, 13, 3, 4, 14, 7, 5, 11],
+     [10, 15, 4, 2, 7, 12, 9, 5, 6, 1, 13, 14, 0, 11, 3, 8],
+     [9, 14, 15, 5, 2, 8, 12, 3, 7, 0, 4, 10, 1, 13, 11, 6],
+     [4, 3, 2, 12, 9, 5, 15, 10, 11, 14, 1, 7, 6, 0, 8, 13]],
+    [[4, 11, 2, 14, 15, 0, 8, 13, 3, 12, 9, 7, 5, 10, 6, 1],
+     [13, 0, 11, 7, 4, 9, 1, 10, 14, 3, 5, 12, 2, 15, 8, 6],
+     [1, 4, 11, 13, 12, 3, 7, 14, 10, 15, 6, 8, 0, 5, 9, 2],
+     [6, 11, 13, 8, 1, 4, 10, 7, 9, 5, 0, 15, 14, 2, 3, 12]],
+    [[13, 2, 8, 4, 6, 15, 11, 1, 10, 9, 3, 14, 5, 0, 12, 7],
+     [1, 15, 13, 8, 10, 3, 7, 4, 12, 5, 6, 11, 0, 14, 9, 2],
+     [7, 11, 4, 1, 9, 12, 14, 2, 0, 6, 10, 13, 15, 3, 5, 8],
+     [2, 1, 14, 7, 4, 10, 8, 13, 15, 12, 9, 0, 3, 5, 6, 11]],
+]
+
+# output bit i <- input bit table[i] (bit 0 is the most significant one, as in des.js)
+_P = [15, 6, 19, 20, 28, 11, 27, 16, 0, 14, 22, 25, 4, 17, 30, 9,
+      1, 7, 23, 13, 31, 26, 2, 8, 18, 12, 29, 5, 21, 10, 3, 24]
+
+_FP = [39, 7, 47, 15, 55, 23, 63, 31, 38, 6, 46, 14, 54, 22, 62, 30,
+       37, 5, 45, 13, 53, 21, 61, 29, 36, 4, 44, 12, 52, 20, 60, 28,
+       35, 3, 43, 11, 51, 19, 59, 27, 34, 2, 42, 10, 50, 18, 58, 26,
+       33, 1, 41, 9, 49, 17, 57, 25, 32, 0, 40, 8, 48, 16, 56, 24]
+
+_PC2 = [13, 16, 10, 23, 0, 4, 2, 27, 14, 5, 20, 9, 22, 18, 11, 3,
+        25, 7, 15, 6, 26, 19, 12, 1, 40, 51, 30, 36, 46, 54, 29, 39,
+        50, 44, 32, 47, 43, 48, 38, 55, 33, 52, 45, 41, 49, 35, 28, 31]
+
+_SHIFTS = [1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1]
+
+
+def _init_permute_table():
+    table = [0] * 64
+    for i in range(4):
+        m, n = 2 * i + 1, 2 * i
+        for k in range(8):
+            j = 7 - k
+            table[i * 8 + k] = j * 8 + m
+            table[i * 8 + k + 32] = j * 8 + n
+    return table
+
+
+def _byte_tables(table):
+    """
+    split a 64-bit permutation into 8 byte-indexed lookup tables
+    """
+    tables = [[0] * 256 for _ in range(8)]
+    for out_bit, in_bit in enumerate(table):
+        byte, bit = divmod(in_bit, 8)
+        mask = 1 << (63 - out_bit)
+        for v in range(256):
+            if v & (0x80 >> bit):
+                tables[byte][v] |= mask
+    return tables
+
+
+def _sp_tables():
+    """
+    merge every S-box with the P permutation: _SP[m][6 bits] -> 32-bit word
+    """
+    tables = []
+    for m, box in enumerate(_S_BOXES):
+        row = []
+        for v in range(64):
+            s = box[(v >> 4 & 2) | (v & 1)][v >> 1 & 15] << (28 - 4 * m)
+            p = 0
+            for out_bit, in_bit in enumerate(_P):
+                if s & (1 << (31 - in_bit)):
+                    p |= 1 << (31 - out_bit)
+            row.append(p)
+        tables.append(row)
+    return tables
+
+
+_IP_TABLES = _byte_tables(_init_permute_table())
+_FP_TABLES = _byte_tables(_FP)
+_SP = _sp_tables()
+
+
+def _permute(block, tables):
+    t0, t1, t2, t3, t4, t5, t6, t7 = tables
+    return (t0[block >> 56] | t1[block >> 48 & 255] | t2[block >> 40 & 255] | t3[block >> 32 & 255] |
+            t4[block >> 24 & 255] | t5[block >> 16 & 255] | t6[block >> 8 & 255] | t7[block & 255])
+
+
+def _str_to_block(s):
+    """
+    4 UTF-16 code units (zero padded) -> 64-bit block, like strToBt
+    """
+    return int.from_bytes(s.ljust(8, b'\0'), 'big')
+
+
+def _to_code_units(s):
+    return s.encode('utf-16-be', 'surrogatepass')
+
+
+@lru_cache(maxsize=64)
+def _generate_keys(key_block):
+    """
+    16 round keys for one 64-bit key block, like generateKeys
+    each round key is a tuple of 8 6-bit chunks
+    """
+    bits = [(key_block >> (63 - i)) & 1 for i in range(64)]
+    key = [0] * 56
+    for i in range(7):
+        for j in range(8):
+            key[i * 8 + j] = bits[8 * (7 - j) + i]
+
+    keys = []
+    for shift in _SHIFTS:
+        key = key[shift:28] + key[:shift] + key[28 + shift:] + key[28:28 + shift]
+        k = 0
+        for i in _PC2:
+            k = k << 1 | key[i]
+        keys.append(tuple((k >> (42 - 6 * m)) & 63 for m in range(8)))
+    return tuple(keys)
+
+
+@lru_cache(maxsize=64)
+def _key_schedule(key):
+    """
+    round keys for every 4-char block of a key string, like getKeyBytes
+    """
+    if not key:
+        return ()
+    units = _to_code_units(key)
+    return tuple(_generate_keys(_str_to_block(units[i:i + 8])) for i in range(0, len(units), 8))
+
+
+def _crypt_block(block, keys):
+    block = _permute(block, _IP_TABLES)
+    left = block >> 32
+    right = block & 0xFFFFFFFF
+    sp0, sp1, sp2, sp3, sp4, sp5, sp6, sp7 = _SP
+    for k0, k1, k2, k3, k4, k5, k6, k7 in keys:
+        e = (right & 1) << 33 | right << 1 | right >> 31
+        left, right = right, left ^ (
+            sp0[(e >> 28 ^ k0) & 63] | sp1[(e >> 24 ^ k1) & 63] |
+            sp2[(e >> 20 ^ k2) & 63] | sp3[(e >> 16 ^ k3) & 63] |
+            sp4[(e >> 12 ^ k4) & 63] | sp5[(e >> 8 ^ k5) & 63] |
+            sp6[(e >> 4 ^ k6) & 63] | sp7[(e ^ k7) & 63])
+    return _permute(right << 32 | left, _FP_TABLES)
+
+
+def _schedules(first_key, second_key, third_key):
+    """
+    keys applied in order, following the null/empty checks of strEnc
+    """
+    schedules = []
+    for key in (first_key, second_key, third_key):
+        if not key:
+            break
+        schedules.extend(_key_schedule(key))
+    return schedules
+
+
+def str_enc(data, first_key, second_key=None, third_key=None):
+    """
+    encrypt a string to upper-case hex, byte-identical to strEnc in des.js
+    :param data: string to be encrypted
+    :param first_key: key (e.g. _deskey)
+    :return: hex string
+    """
+    schedules = _schedules(first_key, second_key, third_key)
+    if not data or not schedules:
+        return ''
+    units = _to_code_units(data)
+    result = []
+    for i in range(0, len(units), 8):
+        block = _str_to_block(units[i:i + 8])
+        for keys in schedules:
+            block = _crypt_block(block, keys)
+        result.append('%016X' % block)
+    return ''.join(result)
+
+
+def str_dec(data, first_key, second_key=None, third_key=None):
+    """
+    decrypt a hex string produced by str_enc, like strDec in des.js
+    :param data: hex string
+    :param first_key: key (e.g. _deskey)
+    :return: original string
+    """
+    schedules = [keys[::-1] for keys in reversed(_schedules(first_key, second_key, third_key))]
+    result = bytearray()
+    for i in range(0, len(data) // 16 * 16, 16):
+        block = int(data[i:i + 16], 16)
+        for keys in schedules:
+            block = _crypt_block(block, keys)
+        for j in range(48, -16, -16):
+            unit = block >> j & 0xFFFF
+            if unit:
+                result += unit.to_bytes(2, 'big')
+    return result.decode('utf-16-be', 'surrogatepass')
+
+
+class PythonDES:
+    """
+    DES engine running natively in Python
+    """
+    name = 'python'
+
+    def str_enc(self, data, key):
+        return str_enc(data, key)
+
+    def str_dec(self, data, key):
+        return str_dec(data, key)
+
+
+class ExecJSDES:
+    """
+    DES engine running des.js through PyExecJS
+    """
+    name = 'execjs'
+
+    def __init__(self, path='des.js'):
+        import execjs
+        with open(path, 'r', encoding='utf8') as f:
+            self._ctx = execjs.compile(f.read())
+
+    def str_enc(self, data, key):
+        return self._ctx.call('strEnc', data, key)
+
+    def str_dec(self, data, key):
+        return self._ctx.call('strDec', data, key)
+
+
+DES_ENGINES = {
+    PythonDES.name: PythonDES,
+    ExecJSDES.name: ExecJSDES,
+}
+
+
+def get_des_engine(name='python'):
+    """
+    :param name: 'python' (default) or 'execjs'
+    :return: DES engine instance
+    """
+    if name not in DES_ENGINES:
+        raise ValueError('unknown DES engine: ' + str(name))
+    return DES_ENGINES[name]()
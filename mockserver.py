@@ -0,0 +1,660 @@
+"""
+local stand-in for the zyfw / cas endpoints used by BNUjwc
+
+    server = MockServer(plan_courses=200, elective_courses=1000, latency=0.02, rate_limit=3)
+    server.start()
+    jwc = BNUjwc(server.username, server.password, base_url=server.url)
+
+or run it standalone: python mockserver.py --port 8080 --elective 1000
+"""
+import argparse
+import base64
+import hashlib
+import html
+import json
+import random
+import string
+import threading
+import time
+import urllib.parse
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import des
+
+_tz = timezone(timedelta(hours=8))
+_weekdays = '一二三四五六日'
+_weeks = ['1-16周', '1-16周', '1-16周', '1-8周', '9-16周', '1-15单周', '2-16双周']
+_buildings = ['八', '七', '四', '教二', '电子楼']
+_categories = ['学校平台/大学外语模块/必修', '学校平台/思想政治理论模块/必修', '学校平台/通识教育模块/选修',
+               '学校平台/体育与健康模块/必修', '学院平台/学科基础课程/必修', '专业平台/专业选修课程/选修']
+
+
+def _md5(s):
+    return hashlib.md5(s.encode('ascii')).hexdigest()
+
+
+def synthetic_courses(plan_courses=100, elective_courses=300, seed=2016, capacity=(20, 120)):
+    """
+    generate a catalog: [{'kind': 'plan' | 'elective', 'kcdm', 'kc', 'xf', ..., 'sections': [...]}, ...]
+    """
+    rnd = random.Random(seed)
+    courses = []
+    for kind, count in (('plan', plan_courses), ('elective', elective_courses)):
+        for i in range(count):
+            kcdm = '%010d' % rnd.randint(0, 9999999999)
+            course = {
+                'kind': kind, 'kcdm': kcdm, 'kc': '[%s]%s课程%d' % (kcdm, '计划' if kind == 'plan' else '公选', i),
+                'xf': '%.1f' % rnd.choice((1, 1.5, 2, 3, 4)), 'zxs': str(rnd.choice((16, 32, 48, 64))),
+                'kclb1': '%02d' % rnd.randint(1, 20), 'kclb2': '%02d' % rnd.randint(1, 20), 'khfs': '01',
+                'lb': rnd.choice(_categories), 'sections': [],
+            }
+            for j in range(rnd.randint(1, 3)):
+                periods = []
+                for _ in range(rnd.choice((1, 1, 2))):
+                    first = rnd.choice((1, 3, 5, 7, 9, 11))
+                    periods.append('%s[%d-%d]' % (rnd.choice(_weekdays[:5]), first, first + 1))
+                weeks = rnd.choice(_weeks)
+                room = '%s%d' % (rnd.choice(_buildings), rnd.randint(101, 520))
+                cap = rnd.randint(*capacity)
+                course['sections'].append({
+                    'skbjdm': '%s-%02d' % (kcdm, j + 1), 'skbj': '%02d' % (j + 1),
+                    'rkjs': '[%05d]教师%d' % (rnd.randint(0, 99999), rnd.randint(1, 400)),
+                    'sksj': weeks + ' ' + ' '.join(periods), 'skdd': room,
+                    'sksjdd': weeks + ' ' + ' '.join(p + ' ' + room for p in periods),
+                    'capacity': cap, 'selected': rnd.randint(0, cap),
+                })
+            courses.append(course)
+    return courses
+
+
+def render_table(rows):
+    """
+    DataTable.jsp-like page, one <td name=...> per field
+    """
+    out = ['<html><head><title>DataTable</title></head><body>'
+           '<table id="tb" class="tableBorder"><thead><tr><th>序号</th></tr></thead><tbody>']
+    for i, row in enumerate(rows):
+        out.append('<tr class="%s">' % ('odd' if i % 2 else 'even'))
+        for name, value in row.items():
+            if name == 'operation':
+                out.append('<td name="operation" align="center"><a href="javascript:void(0)">%s</a></td>'
+                           % html.escape(value))
+            else:
+                out.append('<td name="%s" align="center" nowrap>%s</td>' % (name, html.escape(str(value))))
+        out.append('<td align="center">&nbsp;</td></tr>\n')
+    out.append('</tbody></table></body></html>')
+    return ''.join(out)
+
+
+def render_result_tables(tables):
+    """
+    plain tables (lists of rows of cells) as the result / score pages render them
+    """
+    out = ['<html><body>']
+    for title, rows in tables:
+        out.append('<table class="tableBorder">')
+        if title:
+            out.append('<thead><tr>%s</tr></thead>' % ''.join('<td>%s</td>' % html.escape(x) for x in title))
+        for row in rows:
+            out.append('<tr>%s</tr>' % ''.join('<td>%s</td>' % html.escape(str(x)).replace('\xa0', '&nbsp;')
+                                               for x in row))
+        out.append('</table>')
+    out.append('</body></html>')
+    return ''.join(out)
+
+
+class MockState:
+    """
+    data and behaviour shared by all requests of a MockServer
+    """
+    def __init__(self, username='201411000000', password='19960101', plan_courses=100, elective_courses=300,
+                 seed=2016, latency=0.0, jitter=0.0, rate_limit=None, deskey_lifetime=300,
+                 window=None, evaluate_courses=8, stall=0.0, stall_time=10.0, charset=True):
+        """
+        :param latency: seconds added to every response
+        :param jitter: random extra seconds, up to
+        :param rate_limit: max selection / cancel requests per second per session before status 300
+        :param deskey_lifetime: seconds a _deskey is accepted
+        :param window: (start, end) epoch seconds of the selection window, open for a day by default
+        :param stall: fraction of responses held back for stall_time seconds, like a stuck upstream
+        :param charset: name the charset in Content-Type, False serves bare 'text/html' etc.
+        """
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.deskey_lifetime = deskey_lifetime
+        self.stall = stall
+        self.stall_time = stall_time
+        self.charset = charset
+        now = time.time()
+        self.window = window or (now - 3600, now + 86400)
+        self.courses = synthetic_courses(plan_courses, elective_courses, seed)
+        self.sections = {}
+        for course in self.courses:
+            for section in course['sections']:
+                self.sections[section['skbjdm']] = (course, section)
+        self.selected = []
+        self.evaluated = set()
+        self.evaluate_courses = evaluate_courses
+        self.sessions = set()
+        self.deskeys = {}
+        self.requests = defaultdict(int)
+        self.bytes_sent = 0
+        self._recent = defaultdict(deque)
+        self._rnd = random.Random(seed)
+        self.lock = threading.Lock()
+
+    # --- info ---
+
+    def student_info(self):
+        return {'xh': self.username, 'zydm': '0410', 'nj': '2014', 'xn': '2015', 'zymc': '计算机科学与技术', 'xq_m': '1'}
+
+    def select_info(self, xktype):
+        start, end = (datetime.fromtimestamp(x, _tz).strftime('%Y-%m-%d %H:%M:%S') for x in self.window)
+        return {'xktype': str(xktype), 'xh': self.username, 'xn': '2015', 'xqM': '1', 'nj': '2014',
+                'kssj': start, 'jssj': end}
+
+    def window_text(self):
+        start, end = (datetime.fromtimestamp(x, _tz).strftime('%Y-%m-%d %H:%M') for x in self.window)
+        return '学年学期：2015-2016\xa0\xa0春季学期\xa0\xa0时间区段：%s→%s' % (start, end)
+
+    def expire_sessions(self):
+        """
+        log every client out, their next request is redirected to CAS
+        """
+        with self.lock:
+            self.sessions.clear()
+
+    # --- deskey / throttle ---
+
+    def new_deskey(self):
+        with self.lock:
+            now = time.time()
+            for key, issued in list(self.deskeys.items()):
+                if now - issued > self.deskey_lifetime:
+                    del self.deskeys[key]
+            key = ''.join(self._rnd.choice(string.ascii_letters + string.digits) for _ in range(8))
+            self.deskeys[key] = now
+            return key
+
+    def throttled(self, session):
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.time()
+            recent = self._recent[session]
+            while recent and recent[0] <= now - 1:
+                recent.popleft()
+            recent.append(now)
+            return len(recent) > self.rate_limit
+
+    def decrypt(self, form):
+        """
+        :return: decrypted params dict, None if no live _deskey / token matches
+        """
+        try:
+            hex_params = base64.b64decode(form['params']).decode('ascii')
+            token, timestamp = form['token'], form['timestamp']
+        except (KeyError, ValueError):
+            return None
+        now = time.time()
+        for key, issued in list(self.deskeys.items()):
+            if now - issued > self.deskey_lifetime:
+                continue
+            params = des.str_dec(hex_params, key)
+            try:
+                params.encode('ascii')
+            except UnicodeEncodeError:
+                continue
+            if _md5(_md5(params) + _md5(timestamp)) == token:
+                return {k: v[0] for k, v in urllib.parse.parse_qs(params, keep_blank_values=True).items()}
+        return None
+
+    # --- selection ---
+
+    def seats(self, section):
+        return section['selected'], section['capacity'], section['capacity'] - section['selected']
+
+    def select(self, params):
+        now = time.time()
+        if not self.window[0] <= now <= self.window[1]:
+            return '400', '非有效选课时间'
+        skbjdm = params.get('skbjdm', '')
+        with self.lock:
+            if skbjdm not in self.sections:
+                return '400', '课程不存在'
+            course, section = self.sections[skbjdm]
+            if any(self.sections[x][0] is course for x in self.selected):
+                return '400', '该课程已选'
+            if section['selected'] >= section['capacity']:
+                return '400', '人数已满'
+            section['selected'] += 1
+            self.selected.append(skbjdm)
+        return '200', '选课成功'
+
+    def cancel(self, params):
+        skbjdm = params.get('skbjdm', '')
+        with self.lock:
+            if skbjdm not in self.selected:
+                return '400', '未选该课程'
+            self.selected.remove(skbjdm)
+            self.sections[skbjdm][1]['selected'] -= 1
+        return '200', '退选成功'
+
+    # --- tables ---
+
+    def plan_rows(self, full):
+        rows = []
+        for course in self.courses:
+            if course['kind'] != 'plan':
+                continue
+            section = course['sections'][0]
+            if not full and all(x['selected'] >= x['capacity'] for x in course['sections']):
+                continue
+            selected = any(x['skbjdm'] in self.selected for x in course['sections'])
+            rows.append({
+                'kcxz': '01', 'xkfs': '学生网上选', 'sksjdd': section['sksjdd'], 'rkjs': section['rkjs'],
+                'kcdm': course['kcdm'], 'zxs': course['zxs'], 'xk_status': '选中' if selected else '',
+                'skbjdm': section['skbjdm'], 'xk_points': '0', 'xf': course['xf'], 'kclb2': course['kclb2'],
+                'khfs': course['khfs'], 'lb': course['lb'], 'operation': '查看', 'kclb1': course['kclb1'],
+                'kc': course['kc'], 'is_buy_book': '0', 'is_cx': '0',
+            })
+        return rows
+
+    def elective_rows(self, full):
+        rows = []
+        for course in self.courses:
+            if course['kind'] != 'elective':
+                continue
+            for section in course['sections']:
+                selected, capacity, free = self.seats(section)
+                if not full and free <= 0:
+                    continue
+                rows.append({
+                    'xkfs': '学生网上选', 'sksj': section['sksj'], 'rkjs': section['rkjs'], 'kcdm': course['kcdm'],
+                    'zxs': course['zxs'], 'xz': '已选中' if section['skbjdm'] in self.selected else '',
+                    'skbjdm': section['skbjdm'], 'xk_points': '0', 'xf': course['xf'], 'kclb2': course['kclb2'],
+                    'khfs': course['khfs'], 'lb': course['lb'], 'operation': '查看', 'kclb1': course['kclb1'],
+                    'kc': course['kc'], 'is_buy_book': '0', 'is_cx': '0', 'skfs': '理论',
+                    'yxrs': '%d/0' % selected, 'skdd': section['skdd'], 'xxrs': str(capacity),
+                    'skbj': section['skbj'], 'kxrs': str(free),
+                })
+        return rows
+
+    def view_plan_rows(self, kcdm):
+        rows = []
+        for course in self.courses:
+            if course['kcdm'] != kcdm:
+                continue
+            for section in course['sections']:
+                selected, capacity, free = self.seats(section)
+                rows.append({
+                    'sksj': section['sksj'], 'rkjs': section['rkjs'], 'current_skbjdm': section['skbjdm'],
+                    'skbjdm': section['skbjdm'], 'skfs_mc': '理论', 'xkrs': '%d/0' % selected,
+                    'skdd': section['skdd'], 'xkrssx': str(capacity), 'kxrs': str(free), 'xqdm': '0',
+                    'xqmc': '本部', 'skfs_m': '0',
+                })
+        return rows
+
+    def cancel_rows(self):
+        rows = []
+        for skbjdm in self.selected:
+            course, section = self.sections[skbjdm]
+            rows.append({
+                'xkfs': '学生网上选', 'sksjdd': section['sksjdd'], 'rkjs': section['rkjs'], 'school_name': '本部',
+                'kcdm': course['kcdm'], 'zxs': course['zxs'], 'xk_status': '选中', 'skbjdm': skbjdm,
+                'xk_points': '0', 'xf': course['xf'], 'kclb2': course['kclb2'], 'show_skbjdm': skbjdm,
+                'khfs': course['khfs'], 'lb': course['lb'], 'operation': '退选', 'kclb1': course['kclb1'],
+                'kc': course['kc'], 'kcxz': '01',
+            })
+        return rows
+
+    def exam_rows(self):
+        return [{'xf': course['xf'], 'ksdd': '本部 教八 %d' % (101 + i), 'khfs': '考试',
+                 'kssj': '2016-01-%02d(18周 星期三)13:30-15:10' % (4 + i % 10), 'zwh': str(i + 1),
+                 'kc': course['kc'], 'lb': course['lb']}
+                for i, course in enumerate(self.sections[x][0] for x in self.selected)]
+
+    def result_page(self):
+        modules = [[x, '10.0', '4.0', '6.0', '', '5', '2', '3', ''] for x in
+                   ('学校平台/思想政治理论模块', '学校平台/大学外语模块', '学校平台/通识教育模块')]
+        courses = []
+        for i, skbjdm in enumerate(self.selected):
+            course, section = self.sections[skbjdm]
+            selected, capacity, free = self.seats(section)
+            courses.append([str(i + 1), course['kc'], course['xf'], course['lb'].split('/')[1],
+                            section['rkjs'].split(']')[-1], section['skbj'], section['skbj'] + '班', '学生网上选',
+                            str(selected), str(capacity), str(free),
+                            section['sksjdd'].replace(' ', '\xa0'), skbjdm])
+        return render_result_tables([
+            (None, [[self.window_text()]]),
+            (['模块', '限选学分', '已选学分', '可选学分', '指定学分', '限选门数', '已选门数', '可选门数', '指定门数'], modules),
+            (['序号', '课程', '学分', '类别', '任课教师', '上课班号', '上课班级名称', '选课方式', '已选人数', '限选人数',
+              '可选人数', '上课时间地点', '课程代码'], courses),
+        ])
+
+    def score_page(self, count=40):
+        rows = []
+        for i in range(count):
+            course = self.courses[i % len(self.courses)]
+            semester = '%d-%d学年%s学期' % (2014 + i // 20, 2015 + i // 20, '秋季' if i // 10 % 2 == 0 else '春季')
+            rows.append([semester if i % 10 == 0 else '', course['kc'], course['xf'], '公共课/必修课', '初修',
+                         '%.1f' % (60 + i % 40), '%.1f' % (55 + i % 45), '%.1f' % (58 + i % 42), '主修', ''])
+        title = ['学年学期', '课程/环节', '学分', '类别', '修读性质', '平时成绩', '期末成绩', '综合成绩', '辅修标记', '备注']
+        return render_result_tables([(title, rows)])
+
+    def evaluate_rounds(self):
+        return [{'qsrq': '2015-12-14', 'sfwjpj': '1', 'sfzbpj': '1', 'xn': '2015', 'xq_m': '0', 'pjfsbz': '0',
+                 'lcjc': '本科课堂教学终结评价', 'lcqc': '2015-2016学年秋季学期', 'jsrq': '2016-01-03', 'sfkpsj': '0',
+                 'lcdm': '2015002'}]
+
+    def evaluate_course_list(self):
+        rows = []
+        for i, course in enumerate(self.courses[:self.evaluate_courses]):
+            section = course['sections'][0]
+            rows.append({'pjlb_m': '01' if i % 3 else '02', 'gh': '%05d' % (93100 + i), 'kcmc': course['kc'],
+                         'xm': section['rkjs'].split(']')[-1], 'kcdm': course['kcdm'], 'skbjdm': section['skbjdm'],
+                         'pjlbmc': '理论课' if i % 3 else '实验课', 'ypflag': '0', 'yhdm': course['kcdm'],
+                         'xf': course['xf'], 'sfzjjs': '1', 'jsid': '%06d' % (6000 + i), 'pjzt_m': '20'})
+        return rows
+
+    def evaluate_form(self, pjlb_m):
+        out = ['<html><body><form>']
+        for i in range(10 if pjlb_m == '01' else 6):
+            code = '%s%03d' % (pjlb_m, i)
+            for score in range(5, 0, -1):
+                out.append('<input type="radio" name="zb%s" value="%d@%s@0%d"/>' % (code, score, code, 6 - score))
+        for i in range(2):
+            out.append('<textarea tmbh="wj%s%02d" rows="3"></textarea>' % (pjlb_m, i))
+        out.append('</form></body></html>')
+        return ''.join(out)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # write headers and body in one segment, keep-alive would stall on delayed ACKs otherwise
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- helpers ---
+
+    def _session(self):
+        for part in self.headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'JSESSIONID':
+                return value
+        return None
+
+    def _form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        form = {k: v[0] for k, v in urllib.parse.parse_qs(body, keep_blank_values=True).items()}
+        return form
+
+    def _send(self, body, status=200, content_type='text/html;charset=UTF-8', headers=()):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        state = self.state
+        if not state.charset:
+            content_type = content_type.split(';')[0]
+        delay = state.latency + (random.random() * state.jitter if state.jitter else 0)
+        if state.stall and random.random() < state.stall:
+            delay += state.stall_time
+        if delay:
+            time.sleep(delay)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting
+            self.close_connection = True
+            return
+        with state.lock:
+            state.bytes_sent += len(data)
+
+    def _json(self, value):
+        self._send(json.dumps(value, ensure_ascii=False), content_type='application/json;charset=UTF-8')
+
+    def _redirect(self, location, headers=()):
+        self._send('', 302, headers=[('Location', location)] + list(headers))
+
+    def _login_page(self, error=''):
+        return ('<html><head><title>统一身份认证</title></head><body><form method="post">%s'
+                '<input type="hidden" name="lt" value="LT-%d-mock" />\n'
+                '<input type="hidden" name="execution" value="e1s1" />\n'
+                '</form></body></html>' % (error, random.randint(0, 1 << 30)))
+
+    # --- dispatch ---
+
+    def do_HEAD(self):
+        self._route('HEAD')
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def _route(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query, keep_blank_values=True).items()}
+        form = self._form() if method == 'POST' else {}
+        state = self.state
+        with state.lock:
+            state.requests[url.path] += 1
+
+        if url.path == '/cas/login':
+            return self._cas_login(method, form)
+        if url.path == '/':
+            return self._send('<html><body>zyfw</body></html>')
+        if url.path == '/cas/logon.action':
+            return self._old_login(form)
+        if url.path == '/cas/genValidateCode':
+            return self._send(b'\xff\xd8\xff\xd9', content_type='image/jpeg')
+        if self._session() not in state.sessions:
+            return self._redirect('/cas/login?service=%2FMainFrm.html')
+
+        handler = self._routes.get(url.path)
+        if handler is None:
+            return self._send('<html><body>404</body></html>', 404)
+        handler(self, query, form)
+
+    def _cas_login(self, method, form):
+        state = self.state
+        if method != 'POST':
+            return self._send(self._login_page())
+        if form.get('username') != state.username or form.get('password') != state.password:
+            return self._send(self._login_page('<div id="msg">用户名密码输入有误。</div>'))
+        session = '%032x' % random.getrandbits(128)
+        with state.lock:
+            state.sessions.add(session)
+        self._redirect('/MainFrm.html', [('Set-Cookie', 'JSESSIONID=%s; Path=/' % session)])
+
+    def _old_login(self, form):
+        state = self.state
+        if form.get('username') != state.username:
+            return self._json({'status': '400', 'message': '用户名或密码错误'})
+        session = '%032x' % random.getrandbits(128)
+        with state.lock:
+            state.sessions.add(session)
+        self._send(json.dumps({'status': '200', 'message': '登录成功'}), content_type='application/json',
+                   headers=[('Set-Cookie', 'JSESSIONID=%s; Path=/' % session)])
+
+    def _main_frame(self, query, form):
+        self._send('<html><head><title>北京师范大学 综合服务</title></head><body>MainFrm</body></html>')
+
+    def _student_info(self, query, form):
+        info = self.state.student_info()
+        xh = info.pop('xh')
+        self._send('<?xml version="1.0" encoding="UTF-8"?><root><xh>%s</xh><info>%s</info></root>'
+                   % (xh, ''.join('<%s>%s</%s>' % (k, v, k) for k, v in info.items())), content_type='text/xml')
+
+    def _grade_info(self, query, form):
+        self._json({'result': json.dumps({'zydm': '0410', 'nj': '2014'})})
+
+    def _select_info(self, query, form):
+        self._json({'result': json.dumps(self.state.select_info(query.get('xktype', '2')), ensure_ascii=False)})
+
+    def _deskey(self, query, form):
+        self._send("var _deskey = '%s';" % self.state.new_deskey(), content_type='application/javascript')
+
+    def _selection(self, query, form, cancel=False):
+        state = self.state
+        if state.throttled(self._session()):
+            return self._json({'status': '300', 'result': None, 'message': '操作过于频繁，请稍后再试'})
+        params = state.decrypt(form)
+        if params is None:
+            return self._json({'status': '400', 'result': None, 'message': '非法请求: token 校验失败'})
+        status, message = state.cancel(params) if cancel else state.select(params)
+        self._json({'status': status, 'result': None, 'message': message})
+
+    def _select(self, query, form):
+        self._selection(query, form)
+
+    def _cancel(self, query, form):
+        self._selection(query, form, cancel=True)
+
+    def _table(self, query, form):
+        state = self.state
+        table_id = query.get('tableId', '')
+        full = form.get('xwxmkc') != 'on'
+        if table_id == '5327018':
+            rows = state.plan_rows(full)
+        elif table_id == '5327095':
+            rows = state.elective_rows(full)
+        elif table_id == '6142':
+            rows = state.view_plan_rows(query.get('kcdm', ''))
+        elif table_id == '6093':
+            rows = state.cancel_rows()
+        elif table_id == '2538':
+            rows = state.exam_rows()
+        elif table_id == '50058':
+            calls = ''.join('<a href="#" onclick=\'parent.jxpj("%s","%d")\'>评价</a>\n'
+                            % (json.dumps(x, ensure_ascii=False).replace('"', '\\"'), i)
+                            for i, x in enumerate(state.evaluate_course_list()) if x['jsid'] not in state.evaluated)
+            return self._send('<html><body>%s</body></html>' % calls)
+        else:
+            return self._send('<html><body>unknown table</body></html>', 404)
+        self._send(render_table(rows))
+
+    def _selection_result(self, query, form):
+        self._send(self.state.result_page())
+
+    def _droplist(self, query, form):
+        self._json([{'code': '2015,0,1', 'name': '2015-2016学年秋季学期随堂考试'},
+                    {'code': '2015,0,2', 'name': '2015-2016学年秋季学期期末考试'}])
+
+    def _scores(self, query, form):
+        self._send(self.state.score_page())
+
+    def _evaluate_list(self, query, form):
+        self._send('<select>%s</select>' % ''.join(
+            "<option value='%s'>%s</option>" % (json.dumps(x, ensure_ascii=False), x['lcqc'])
+            for x in self.state.evaluate_rounds()))
+
+    def _evaluate_form(self, query, form):
+        self._send(self.state.evaluate_form(query.get('pjlb_m', '01')))
+
+    def _evaluate_save(self, query, form):
+        if not form.get('wspjZbpjWjdcForm.commitZB'):
+            return self._json({'status': '400', 'result': None, 'message': '评价内容不完整'})
+        with self.state.lock:
+            self.state.evaluated.add(form.get('wspjZbpjWjdcForm.jsid'))
+        self._json({'status': '200', 'result': None, 'message': '操作成功!'})
+
+    _routes = {
+        '/MainFrm.html': _main_frame,
+        '/STU_DynamicInitDataAction.do': _student_info,
+        '/jw/common/getStuGradeSpeciatyInfo.action': _grade_info,
+        '/jw/common/getWsxkTimeRange.action': _select_info,
+        '/custom/js/SetKingoEncypt.jsp': _deskey,
+        '/jw/common/saveElectiveCourse.action': _select,
+        '/jw/common/cancelElectiveCourse.action': _cancel,
+        '/taglib/DataTable.jsp': _table,
+        '/student/wsxk.zxjg10139.jsp': _selection_result,
+        '/frame/droplist/getDropLists.action': _droplist,
+        '/student/xscj.stuckcj_data.jsp': _scores,
+        '/jw/wspjZbpjWjdc/getPjlcInfo.action': _evaluate_list,
+        '/student/wspj_tjzbpj_wjdcb_pj.jsp': _evaluate_form,
+        '/jw/wspjZbpjWjdc/save.action': _evaluate_save,
+    }
+
+
+class MockServer:
+    """
+    threaded HTTP server serving MockState, see MockState for the arguments
+    """
+    def __init__(self, host='127.0.0.1', port=0, **kwargs):
+        self.state = MockState(**kwargs)
+        self._httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.state = self.state
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def username(self):
+        return self.state.username
+
+    @property
+    def password(self):
+        return self.state.password
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='local stand-in server for BNUjwc')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--plan', type=int, default=100, help='number of planned courses')
+    parser.add_argument('--elective', type=int, default=300, help='number of elective courses')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds, up to')
+    parser.add_argument('--rate-limit', type=float, default=None, help='selections per second before status 300')
+    parser.add_argument('--deskey-lifetime', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=2016)
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, plan_courses=args.plan, elective_courses=args.elective,
+                        latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                        deskey_lifetime=args.deskey_lifetime, seed=args.seed)
+    print('serving on', server.url, 'user', server.username, 'password', server.password)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
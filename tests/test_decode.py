@@ -0,0 +1,63 @@
+"""
+site encoding learned by BNUjwc when pages come without a charset
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from bnujwc import BNUjwc
+
+ROWS = [{'kcdm': '0410036171', 'kc': '[0410036171]跨文化交际英语课程', 'skdd': '八111'},
+        {'kcdm': '1210041491', 'kc': '[1210041491]男子健美', 'skdd': '风雨操场 健美室2'}]
+
+
+def _page(rows):
+    return '<html><body><table>%s</table></body></html>' % ''.join(
+        '<tr>%s</tr>' % ''.join('<td name="%s">%s</td>' % x for x in row.items()) for row in rows)
+
+
+class _Response:
+    def __init__(self, content, content_type='text/html'):
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict({'Content-Type': content_type})
+        self.encoding = None
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def _stream(jwc, r, chunk_size=7):
+    with jwc._parser('table') as parser:
+        parser.begin()
+        return [dict(x) for x in jwc._iter_chunks(r, parser, None, chunk_size)]
+
+
+def test_stream_learns_gbk_without_charset():
+    jwc = BNUjwc('', '')
+    # ascii head first, so the encoding has to be learned from a later chunk
+    r = _Response((' ' * 40 + _page(ROWS * 20)).encode('gbk'))
+    assert _stream(jwc, r) == ROWS * 20
+    assert _stream(jwc, _Response(_page(ROWS).encode('gbk'))) == ROWS
+
+
+def test_stream_utf8_split_inside_characters():
+    jwc = BNUjwc('', '')
+    assert _stream(jwc, _Response(_page(ROWS).encode('utf-8')), chunk_size=5) == ROWS
+    assert jwc.encoding == 'utf-8'
+
+
+def test_gb_guess_widened_to_gb18030(monkeypatch):
+    jwc = BNUjwc('', '')
+    monkeypatch.setattr(requests.compat.chardet, 'detect', lambda content: {'encoding': 'GB2312'})
+    assert _stream(jwc, _Response(_page(ROWS).encode('gb2312'))) == ROWS
+    assert jwc.encoding == 'gb18030'
+    # later pages reuse it, with characters outside gb2312 and gbk
+    rows = [{'kcdm': '0410036171', 'kc': '张喆', 'skdd': '㐀'}]
+    assert _stream(jwc, _Response(_page(rows).encode('gb18030'))) == rows
@@ -0,0 +1,59 @@
+"""
+BNUjwc.evaluate_all against a local MockServer
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from bnujwc import BNUjwc
+from mockserver import MockServer
+
+FORM_PATH = '/student/wspj_tjzbpj_wjdcb_pj.jsp'
+
+
+@pytest.fixture
+def server():
+    with MockServer(plan_courses=10, elective_courses=10, evaluate_courses=6) as server:
+        yield server
+
+
+def _jwc(server):
+    jwc = BNUjwc(server.username, server.password, base_url=server.url)
+    jwc.login()
+    return jwc
+
+
+def test_forms_are_not_kept_across_rounds(server):
+    jwc = _jwc(server)
+    evaluate = jwc.get_evaluate_list()[0]
+    items = jwc.evaluate_all(evaluate)
+    assert [x['result']['status'] for x in items] == ['200'] * 6
+    assert server.state.requests[FORM_PATH] == 2
+
+    # the next round lists the courses again, its forms are fetched again
+    server.state.evaluated.clear()
+    next_round = dict(evaluate, lcdm='2016001', xn='2016')
+    items = jwc.evaluate_all(next_round)
+    assert [x['result']['status'] for x in items] == ['200'] * 6
+    assert server.state.requests[FORM_PATH] == 4
+
+
+def test_empty_form_is_not_shared(server):
+    jwc = _jwc(server)
+    form = server.state.evaluate_form
+    served = []
+
+    def evaluate_form(pjlb_m):
+        # the first form of each template comes back without choice items
+        served.append(pjlb_m)
+        return '<html><body><form></form></body></html>' if served.count(pjlb_m) == 1 else form(pjlb_m)
+
+    server.state.evaluate_form = evaluate_form
+    items = jwc.evaluate_all(jwc.get_evaluate_list()[0])
+    assert [x['result']['status'] for x in items] == ['200'] * 6
+    # 2 empty forms, then one per course
+    assert server.state.requests[FORM_PATH] == 8
+    assert len(server.state.evaluated) == 6
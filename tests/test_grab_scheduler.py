@@ -0,0 +1,94 @@
+"""
+GrabScheduler.classify on selection answers of the school system
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bnujwc import GrabScheduler
+
+DONE, FULL, INVALID, PENDING = GrabScheduler.DONE, GrabScheduler.FULL, GrabScheduler.INVALID, GrabScheduler.PENDING
+
+
+@pytest.mark.parametrize('status, message, expected', [
+    ('200', '选课成功', (DONE, False)),
+    ('200', '操作成功!', (DONE, False)),
+    ('300', '操作过于频繁，请稍后再试', (PENDING, True)),
+    ('400', '人数已满', (FULL, False)),
+    ('400', '已选人数已满', (FULL, False)),
+    ('400', '该上课班号已选人数已满，不能再选！', (FULL, False)),
+    ('400', '已选人数超过限选人数', (FULL, False)),
+    ('400', '该课程已选', (DONE, False)),
+    ('400', '该课程已选中，不能重复选课', (DONE, False)),
+    ('400', '学分已满', (INVALID, False)),
+    ('400', '本学期选课门数已满', (INVALID, False)),
+    ('400', '上课时间冲突', (INVALID, False)),
+    ('400', '所选学分超过上限', (INVALID, False)),
+    ('400', '非有效选课时间', (PENDING, False)),
+    ('400', '非法请求: token 校验失败', (PENDING, False)),
+])
+def test_classify(status, message, expected):
+    assert GrabScheduler.classify({'status': status, 'result': None, 'message': message}) == expected
+
+
+def test_classify_without_message():
+    assert GrabScheduler.classify({}) == (PENDING, False)
+
+
+class _Prepared(object):
+    name = '课程'
+
+    def encrypt(self, des, deskey):
+        pass
+
+
+class _Jwc(object):
+    _des = None
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.warmed = []
+        self.sent = []
+
+    def warm_connections(self):
+        self.warmed.append(self.clock())
+
+    def invalidate_deskey(self):
+        pass
+
+    def _get_deskey(self):
+        return 'deskey'
+
+    def submit_prepared(self, prepared):
+        self.sent.append(self.clock())
+        return {'status': '200', 'result': None, 'message': '选课成功'}
+
+
+def test_run_at_reads_the_wall_clock_once():
+    wall = iter([1000.0])
+    jwc = _Jwc(time.monotonic)
+    scheduler = GrabScheduler(jwc, wall_clock=lambda: next(wall))
+    scheduler.add(_Prepared())
+    begin = time.monotonic()
+    tasks = scheduler.run_at(1000.3, offset=0.1, warm_lead=0.1)
+    assert tasks[0].state == DONE
+    assert 0.08 <= jwc.warmed[0] - begin < jwc.sent[0] - begin
+    assert 0.19 <= jwc.sent[0] - begin < 1.0
+
+
+def test_stop_interrupts_run_at():
+    jwc = _Jwc(time.monotonic)
+    scheduler = GrabScheduler(jwc)
+    scheduler.add(_Prepared())
+    thread = threading.Thread(target=scheduler.run_at, args=(time.time() + 3600,))
+    thread.start()
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join(1.0)
+    assert not thread.is_alive()
+    assert not jwc.warmed and not jwc.sent
@@ -0,0 +1,101 @@
+"""
+concurrent reads of BNUjwc against a local MockServer agree with serial reads
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bnujwc import BNUjwc, to_json
+from mockserver import MockServer
+
+CALLS = [
+    ('get_plan_courses', True),
+    ('get_elective_courses', True),
+    'get_cancel_courses',
+    'get_selection_result',
+    'get_exam_scores',
+    'get_exam_rounds',
+] * 2
+
+
+def _dumps(results):
+    return [json.dumps(x, default=to_json, sort_keys=True) for x in results]
+
+
+def test_map_reads_survive_expiry():
+    with MockServer(plan_courses=20, elective_courses=40, latency=0.005) as server:
+        jwc = BNUjwc(server.username, server.password, base_url=server.url, read_workers=4)
+        jwc.login()
+        for x in jwc.get_elective_courses(True)[:2]:
+            jwc.select_elective_course(x)
+        expected = _dumps(jwc.map_reads(CALLS, workers=1))
+
+        for i in range(3):
+            if i == 1:
+                server.state.expire_sessions()
+            assert _dumps(jwc.map_reads(CALLS)) == expected
+        jwc.close()
+    # the re-login after the expiry is shared through the cookie jar
+    assert 1 <= jwc.relogin_count <= 2
+
+
+class _Overwritten(BNUjwc):
+    """
+    another thread reads the select info of another xktype right after every write
+    """
+    @property
+    def _select_info(self):
+        return {'xktype': 'other'}
+
+    @_select_info.setter
+    def _select_info(self, value):
+        pass
+
+
+def test_select_info_is_not_read_back():
+    with MockServer(plan_courses=1, elective_courses=1) as server:
+        jwc = _Overwritten(server.username, server.password, base_url=server.url)
+        jwc.login()
+        for xktype in (2, 5, 2, 5):
+            assert jwc._get_select_info(xktype)['xktype'] == str(xktype)
+        assert jwc._get_select_info(5, refresh=True)['xktype'] == '5'
+        jwc.close()
+
+
+class _Counted(BNUjwc):
+    """
+    remembers every session it opens and whether it was closed
+    """
+    def new_session(self):
+        session = super().new_session()
+        session.closed = False
+        close = session.close
+
+        def closing():
+            session.closed = True
+            close()
+
+        session.close = closing
+        self.__dict__.setdefault('opened', []).append(session)
+        return session
+
+
+def test_internal_threads_reuse_sessions():
+    with MockServer(plan_courses=5, elective_courses=5, evaluate_courses=6) as server:
+        jwc = _Counted(server.username, server.password, base_url=server.url, read_workers=2,
+                       deskey_ttl=60, deskey_prefetch=0)
+        jwc.login()
+        for _ in range(3):
+            jwc.map_reads(['get_selection_result', 'get_exam_rounds'] * 2, workers=3)
+            jwc.evaluate_all(jwc.get_evaluate_list()[0], workers=3)
+            server.state.evaluated.clear()
+            jwc.evaluate_all(jwc.get_evaluate_list()[0])
+            server.state.evaluated.clear()
+            for _ in range(5):
+                jwc._get_deskey()
+        jwc.refresh_catalog_async().join()
+        # the calling thread and the shared workers only, the others closed theirs
+        assert sum(not x.closed for x in jwc.opened) <= 1 + jwc.read_workers
+        jwc.close()
@@ -0,0 +1,85 @@
+"""
+TableHTMLParser and TableRegexParser on saved DataTable.jsp pages, whole and fed in chunks
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bnujwc import TABLE_PARSERS
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PAGES = ['table_elective', 'table_omitted_td', 'table_comments']
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES, name + '.html'), encoding='utf-8') as f:
+        page = f.read()
+    with open(os.path.join(FIXTURES, name + '.json'), encoding='utf-8') as f:
+        return page, json.load(f)
+
+
+@pytest.mark.parametrize('parser', sorted(TABLE_PARSERS))
+@pytest.mark.parametrize('name', PAGES)
+def test_feed(parser, name):
+    page, expected = _load(name)
+    p = TABLE_PARSERS[parser]()
+    p.feed(page)
+    assert p.courses == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 20])
+@pytest.mark.parametrize('parser', sorted(TABLE_PARSERS))
+@pytest.mark.parametrize('name', PAGES)
+def test_feed_chunks(parser, name, chunk_size):
+    page, expected = _load(name)
+    p = TABLE_PARSERS[parser]()
+    p.begin()
+    rows = []
+    for i in range(0, len(page), chunk_size):
+        p.feed_chunk(page[i:i + chunk_size])
+        rows.extend(p.pop_courses())
+    p.close()
+    rows.extend(p.pop_courses())
+    assert rows == expected
+
+
+@pytest.mark.parametrize('parser', sorted(TABLE_PARSERS))
+def test_reuse_after_reset(parser):
+    page, expected = _load('table_elective')
+    p = TABLE_PARSERS[parser]()
+    p.feed(page)
+    p.reset()
+    assert p.courses == []
+    p.feed(page)
+    assert p.courses == expected
+
+
+# irregular markup on which both parsers must agree
+MARKUP = [
+    '<tr><td><td name="kc"><b><tr> </tr>',
+    '<tr><td name="a">x<td name="b">y</tr>',
+    '<tr><td name="a">x<tr><td name="b">y</tr>',
+    '<tr><td name="a">x</tr> text <tr><td>z<td name="b">y</td></tr>',
+    '<tr><td name="a"><!-- </tr> -->x</td></tr>',
+]
+
+
+@pytest.mark.parametrize('markup', MARKUP)
+def test_parsers_agree(markup):
+    results = []
+    for cls in TABLE_PARSERS.values():
+        p = cls()
+        p.feed(markup)
+        results.append(p.courses)
+    assert all(x == results[0] for x in results)
+
+
+def test_cell_ends_at_nested_row():
+    for cls in TABLE_PARSERS.values():
+        p = cls()
+        p.feed('<tr><td><td name="kc"><b><tr> </tr>')
+        assert p.courses == []